@@ -0,0 +1,122 @@
+import re
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from time import monotonic, sleep
+import pandas as pd
+
+# The ETL loads SQLite. A .duckdb database is an analytical copy of it with the same tables,
+# kept in step by syncGames, so the data quality checks and shot queries can run columnar and multithreaded.
+# duckdb is only imported when a .duckdb file is used, so the SQLite side runs without it installed.
+
+# columns SQLite lets text into, like 'Undrafted' in draft_year, they are the only ones that become NULL in DuckDB when they don't cast
+loose_columns = {'players':['draft_year','draft_round','draft_number']}
+
+# seconds a SQLite connection waits for another process's write transaction before giving up with "database is locked"
+busy_timeout = 300
+
+
+def isDuckDB(db_name):
+    return str(db_name).endswith('.duckdb')
+
+def connect(db_name,read_only=False):
+    if isDuckDB(db_name):
+        import duckdb
+        # a DuckDB file can only be open in one process while it is written, so like SQLite's busy timeout
+        # a connection waits up to busy_timeout for the other process to close the file
+        wait_until = monotonic() + busy_timeout
+        while True:
+            try:
+                return duckdb.connect(db_name,read_only=read_only)
+            except duckdb.IOException as error:
+                if 'lock' not in str(error) or monotonic() > wait_until:
+                    raise
+                sleep(0.1)
+    if read_only:
+        # autocommit so every query reads the latest commit, it can be shared by threads that take turns using it
+        return sqlite3.connect(f'{Path(db_name).absolute().as_uri()}?mode=ro',uri=True,timeout=busy_timeout,isolation_level=None,check_same_thread=False)
+    # WAL lets the leagues read while another one writes, and IMMEDIATE transactions take the write lock
+    # when they begin, so a writer waits out busy_timeout instead of failing halfway through a date
+    connection = sqlite3.connect(db_name,timeout=busy_timeout,isolation_level='IMMEDIATE')
+    connection.execute('PRAGMA journal_mode=WAL;')
+    return connection
+
+def readQuery(connection,query,values):
+    if isinstance(connection,sqlite3.Connection):
+        return pd.read_sql_query(sql=query, con=connection, params=values)
+    return connection.execute(query,values).df()
+
+def translateQuery(query):
+    # DuckDB doesn't hand out INTEGER PRIMARY KEY ids like SQLite's rowid, so the ids come from a sequence
+    # keys, foreign keys and indexes are left off, they only slow down the bulk appends from syncGames
+    # SQLite's INTEGER is 64 bit and DuckDB's is 32 bit, so INTEGER columns are BIGINT in DuckDB
+    if re.search(r'CREATE (UNIQUE )?INDEX',query):
+        return []
+    table_match = re.search(r'CREATE TABLE (\w+)',query)
+    if table_match is None:
+        return [query]
+    table = table_match.group(1)
+    query = re.sub(r'\bINTEGER\b','BIGINT',query)
+    query = re.sub(r',\s*FOREIGN KEY \([^)]*\) REFERENCES [^,\n]*','',query)
+    query = query.replace('id TEXT PRIMARY KEY','id TEXT')
+    if 'id BIGINT PRIMARY KEY' not in query:
+        return [query]
+    query = query.replace('id BIGINT PRIMARY KEY',f"id BIGINT DEFAULT nextval('{table}_id')")
+    return [f'CREATE SEQUENCE {table}_id;',query]
+
+def runQueries(connection,query_list):
+    if isinstance(connection,sqlite3.Connection):
+        with connection:
+            with closing(connection.cursor()) as cursor:
+                for query in query_list:
+                    print(query)
+                    cursor.execute(query)
+    else:
+        for query in query_list:
+            for duckdb_query in translateQuery(query):
+                print(duckdb_query)
+                connection.execute(duckdb_query)
+
+def syncTable(sqlite_connection,duckdb_connection,table,where,values):
+    # replaces the rows matching where in the DuckDB table with the same rows from SQLite in one columnar append
+    # a value that doesn't cast fails the sync instead of quietly becoming NULL, except in the loose_columns
+    # nullable integer columns stay integers, as floats the 63 bit description ids would lose their last bits
+    df = pd.read_sql_query(sql=f'SELECT * FROM {table} WHERE {where};',con=sqlite_connection,params=values,dtype_backend='numpy_nullable')
+    columns = duckdb_connection.execute(f'DESCRIBE {table};').fetchall()
+    duckdb_connection.execute(f'DELETE FROM {table} WHERE {where};',values)
+    duckdb_connection.register('sync_df',df)
+    duckdb_connection.execute(f"""
+    INSERT INTO {table}
+    SELECT
+        {', '.join(f"{'TRY_CAST' if name in loose_columns.get(table,[]) else 'CAST'}(sync_df.{name} AS {column_type})" for name, column_type, *_ in columns)}
+    FROM sync_df;
+    """)
+    duckdb_connection.unregister('sync_df')
+    return len(df)
+
+def syncGames(sqlite_connection,duckdb_connection,league_id,start,end):
+    # copies the games of a league between start and end (and the small dimension tables) to DuckDB
+    games_where = 'game_id IN (SELECT id FROM games WHERE league_id = ? AND game_date BETWEEN ? AND ?)'
+    seasons_where = 'league_id = ? AND season_id IN (SELECT season_id FROM games WHERE league_id = ? AND game_date BETWEEN ? AND ?)'
+    duckdb_connection.execute('BEGIN TRANSACTION;')
+    try:
+        for table in ['leagues','seasons','season_types','teams','league_season_teams','players','event_message_types','event_message_action_types']:
+            syncTable(sqlite_connection,duckdb_connection,table,'1 = 1',[])
+        # the child tables go first since their where looks up the games still in DuckDB
+        for table in ['game_shot_charts','game_lineups','game_events','game_team_stats']:
+            duckdb_connection.execute(f'DELETE FROM {table} WHERE {games_where};',[league_id,start,end])
+        syncTable(sqlite_connection,duckdb_connection,'games','league_id = ? AND game_date BETWEEN ? AND ?',[league_id,start,end])
+        for table in ['game_team_stats','game_events','game_lineups','game_shot_charts']:
+            syncTable(sqlite_connection,duckdb_connection,table,games_where,[league_id,start,end])
+        # the new etl runs, readers of the copy like queries.Queries clear their cache when the last id changes
+        last_etl_run_id = duckdb_connection.execute('SELECT COALESCE(MAX(id),0) FROM etl_runs;').fetchone()[0]
+        syncTable(sqlite_connection,duckdb_connection,'etl_runs','id > ?',[last_etl_run_id])
+        # only the descriptions of the synced events, the ids are the same in both databases so replacing them is safe
+        descriptions_where = ' UNION '.join(f'SELECT {column} FROM game_events WHERE {games_where}' for column in ['home_description_id','neutral_description_id','visitor_description_id'])
+        syncTable(sqlite_connection,duckdb_connection,'event_descriptions',f'id IN ({descriptions_where})',[league_id,start,end] * 3)
+        for table in ['player_shot_zones','team_shot_zones']:
+            syncTable(sqlite_connection,duckdb_connection,table,seasons_where,[league_id,league_id,start,end])
+        duckdb_connection.execute('COMMIT;')
+    except Exception:
+        duckdb_connection.execute('ROLLBACK;')
+        raise
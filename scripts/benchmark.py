@@ -0,0 +1,110 @@
+import argparse
+import json
+import logging
+import os
+from contextlib import closing
+from datetime import timedelta
+from tempfile import TemporaryDirectory
+import etl
+from backend import connect
+from db import query_list
+from synthetic import SyntheticSession, getSchedule
+
+# times the ETL end to end on synthetic seasons, without network access or rate limiting
+# every run loads into a new database in a temp directory, after loading -history earlier seasons to set the size of the database
+
+logger = logging.getLogger('benchmark')
+
+league_ids = {'NBA':'00','WNBA':'10','GLEAGUE':'20'}
+scale_days = {'day':1,'week':7,'month':30}
+
+
+def parseArguments():
+    # argparse to get what to benchmark
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-league',help='leagues to benchmark (NBA,WNBA,GLEAGUE)',choices=['NBA','WNBA','GLEAGUE'],nargs='+',default=['NBA'])
+    parser.add_argument('-season',help='first year of the season that is timed (YYYY)',type=int,default=2021)
+    parser.add_argument('-scale',help='dates loaded in the timed run, from the first date of the season',choices=['day','week','month','season'],nargs='+',default=['day','month'])
+    parser.add_argument('-history',help='number of earlier seasons loaded into the database before the timed run, one benchmark per value',type=int,nargs='+',default=[0])
+    parser.add_argument('-workers',help='number of api requests that can be in flight at once',type=int,default=4)
+    parser.add_argument('-output',help='also write the results to this json file')
+    args = parser.parse_args()
+    return args
+
+def createDatabase(db_name):
+    with closing(connect(db_name)) as connection:
+        with connection:
+            for query in query_list:
+                connection.execute(query)
+
+def getDates(league_id,season_year,scale):
+    # first and last game date of the scale, counted from the first date of the season with games
+    game_dates = sorted({game_date for game_date, _, _ in getSchedule(league_id,season_year).values()})
+    if scale == 'season':
+        return game_dates[0], game_dates[-1]
+    return game_dates[0], game_dates[0] + timedelta(scale_days[scale] - 1)
+
+def loadDates(connection,league_name,start,end):
+    # loads the dates through the real ETL functions with fresh run stats
+    etl.run_stats = etl.RunStats()
+    etl.loadLeague(connection,league_name,etl.getID(connection,'leagues','league_name',league_name),start,end)
+    return etl.run_stats.getReport()
+
+def runBenchmark(league_name,season_year,scale,history):
+    league_id = league_ids[league_name]
+    with TemporaryDirectory() as temp_dir:
+        db_name = os.path.join(temp_dir,'nba_stats.db')
+        createDatabase(db_name)
+        # the players loaded by a run are kept in memory, so they are cleared for every new database
+        etl.player_ids = None
+        with closing(connect(db_name)) as connection:
+            for history_year in range(season_year - history,season_year):
+                loadDates(connection,league_name,*getDates(league_id,history_year,'season'))
+            db_mb = os.path.getsize(db_name) / 1024 / 1024
+
+            start, end = getDates(league_id,season_year,scale)
+            report = loadDates(connection,league_name,start,end)
+
+    counters = report['counters']
+    seconds = report['seconds']
+    result = {
+        'league':league_name,
+        'season':season_year,
+        'scale':scale,
+        'history':history,
+        'db_mb_before':round(db_mb,1),
+        'start':start.isoformat(),
+        'end':end.isoformat(),
+        'games':counters.get('games',0),
+        'events':counters.get('rows_written.game_events',0),
+        'shots':counters.get('rows_written.game_shot_charts',0),
+        'seconds':seconds,
+        'games_per_second':round(counters.get('games',0) / seconds,2),
+        'events_per_second':round(counters.get('rows_written.game_events',0) / seconds),
+        'stages':report['stages'],
+    }
+    logger.info('%s %s %s history %s (%.1f MB): %s games, %s events, %s shots in %ss, %s games/s, %s events/s',league_name,season_year,scale,history,db_mb,result['games'],result['events'],result['shots'],seconds,result['games_per_second'],result['events_per_second'])
+    return result
+
+
+if __name__ == '__main__':
+    args = parseArguments()
+    logging.basicConfig(level='INFO',format='%(asctime)s %(levelname)s %(message)s')
+    # the etl logs every date at INFO, only its warnings are shown
+    logging.getLogger('etl').setLevel('WARNING')
+
+    # the synthetic session answers every api call, so there is nothing to cache or rate limit
+    etl.session = SyntheticSession()
+    etl.rate_limiter = etl.RateLimiter(1e9)
+    etl.max_workers = args.workers
+    etl.response_cache = None
+
+    results = []
+    for league_name in args.league:
+        for history in args.history:
+            for scale in args.scale:
+                results.append(runBenchmark(league_name,args.season,scale,history))
+
+    if args.output is not None:
+        with open(args.output,'w') as f:
+            json.dump(results,f,indent=4)
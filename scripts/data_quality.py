@@ -1,281 +1,278 @@
+import argparse
 import json
-import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
-import pandas as pd
+from datetime import date, datetime, timedelta
+from backend import connect, readQuery
 
-def readQuery(db_name,query,values):
-    with closing(sqlite3.connect(db_name)) as connection:
-        with connection:
-            df = pd.read_sql_query(sql=query, con=connection, params=values)
-            print(query)
-            return df
+# checks only look at the games of one league between start_date and end_date
+# so a daily run costs the same no matter how much history is in the database
 
-db_name = './assets/data/nba_stats.db'
+logger = logging.getLogger('data_quality')
 
-# Is the number of teams right for each league in a season?
-query = """
-SELECT
-    league_id,
-    season_id,
-    count(team_id) AS team_count,
-    CASE WHEN league_id = '00' THEN 30 -- NBA
-         WHEN league_id = '10' THEN 12 -- WNBA
-         WHEN league_id = '20' THEN 28 -- GLEAGUE
-    END AS expected_team_count
-FROM league_season_teams
-WHERE season_id = 2021
-GROUP BY
-    league_id,
-    season_id
-"""
-print(readQuery(db_name,query,[]))
 
-# Is the number of games right for each league for a set of dates?
-query = """
-SELECT
-    league_id,
-    season_id,
-    season_type_id,
-    count(id) AS game_count,
-    CASE WHEN league_id = '00' THEN 173 -- NBA regular season games
-         WHEN league_id = '10' THEN 17 -- WNBA playoff games
-         WHEN league_id = '20' THEN 6 -- GLEAGUE showcase games
-    END AS expected_game_count
-FROM games
-WHERE
-    (league_id == '00' AND game_date BETWEEN '2021-10-19' AND '2021-11-11')
-    OR
-    (league_id == '10' AND game_date BETWEEN '2021-09-23' AND '2021-10-17')
-    OR
-    (league_id == '20' AND game_date = '2021-11-11')
-GROUP BY
-    league_id,
-    season_id,
-     season_type_id
-"""
-print(readQuery(db_name,query,[]))
+def parseArguments():
+    # argparse to get the league and dates to check
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-ds',help='date to check (YYYY-MM-DD)',type=date.fromisoformat,default=date.today() - timedelta(1))
+    parser.add_argument('-start',help='first date to check (YYYY-MM-DD), checks every date through -end instead of -ds',type=date.fromisoformat)
+    parser.add_argument('-end',help='last date to check (YYYY-MM-DD), defaults to the prior day',type=date.fromisoformat,default=date.today() - timedelta(1))
+    parser.add_argument('-league',help='league to check (NBA,WNBA,GLEAGUE)',choices=['NBA','WNBA','GLEAGUE'],default='NBA')
+    parser.add_argument('-db',help='database to check, a .duckdb file runs the checks on the DuckDB copy',default='./assets/data/nba_stats.db')
+    args = parser.parse_args()
+    return args
 
-# Does the number of games match the number of games in the stats tables
-query = """
-SELECT
-    'games' AS data_source,
-    COUNT(id) AS game_count
-FROM games
-
-UNION ALL
-
-SELECT
-    'game_team_stats' AS data_source,
-    COUNT(DISTINCT game_id) AS game_count
-FROM game_team_stats
-
-UNION ALL
-
-SELECT
-    'game_events' AS data_source,
-    COUNT(DISTINCT game_id) AS game_count
-FROM game_events
+def checkTeamCount(connection,league_id,start,end):
+    # Is the number of teams right for the league in the seasons of the games?
+    query = """
+    SELECT
+        league_season_teams.season_id,
+        COUNT(league_season_teams.team_id) AS team_count,
+        CASE WHEN league_season_teams.league_id = '00' THEN 30 -- NBA
+             WHEN league_season_teams.league_id = '10' THEN 12 -- WNBA
+             WHEN league_season_teams.league_id = '20' THEN 28 -- GLEAGUE
+        END AS expected_team_count
+    FROM league_season_teams
+    WHERE
+        league_season_teams.league_id = ?
+        AND league_season_teams.season_id IN (
+            SELECT
+                season_id
+            FROM games
+            WHERE
+                league_id = ?
+                AND game_date BETWEEN ? AND ?
+        )
+    GROUP BY
+        league_season_teams.league_id,
+        league_season_teams.season_id
+    """
+    df = readQuery(connection,query,[league_id,league_id,start,end])
+    df = df[df['team_count'] != df['expected_team_count']]
+    return [], df.to_dict('records')
 
-UNION ALL
+def checkGameTeamStats(connection,league_id,start,end):
+    # Does every game have a home and an away row in game_team_stats?
+    query = """
+    SELECT
+        games.id AS game_id,
+        SUM(CASE WHEN game_team_stats.home_away = 'home' THEN 1 ELSE 0 END) AS home_count,
+        SUM(CASE WHEN game_team_stats.home_away = 'away' THEN 1 ELSE 0 END) AS away_count
+    FROM games
+    LEFT JOIN game_team_stats
+        ON games.id = game_team_stats.game_id
+    WHERE
+        games.league_id = ?
+        AND games.game_date BETWEEN ? AND ?
+    GROUP BY
+        games.id
+    HAVING
+        home_count <> 1
+        OR away_count <> 1
+    """
+    df = readQuery(connection,query,[league_id,start,end])
+    return df['game_id'].to_list(), df.to_dict('records')
 
-SELECT
-    'game_shot_charts' AS data_source,
-    COUNT(DISTINCT game_id) AS game_count
-FROM game_shot_charts
-"""
-print(readQuery(db_name,query,[]))
+def checkGameEvents(connection,league_id,start,end):
+    # Does every game have play by play events?
+    query = """
+    SELECT
+        games.id AS game_id
+    FROM games
+    WHERE
+        games.league_id = ?
+        AND games.game_date BETWEEN ? AND ?
+        AND NOT EXISTS (
+            SELECT
+                1
+            FROM game_events
+            WHERE
+                game_events.game_id = games.id
+        )
+    """
+    df = readQuery(connection,query,[league_id,start,end])
+    return df['game_id'].to_list(), []
 
-# Does the sum of scores in the game_team_stats equal
-# the sum of scores in the game_events
-query = """
-SELECT
-    'game_team_stats' AS data_source,
-    sum(pts) AS score
-FROM game_team_stats
+def checkGameShotCharts(connection,league_id,start,end):
+    # Does every game have shots?
+    query = """
+    SELECT
+        games.id AS game_id
+    FROM games
+    WHERE
+        games.league_id = ?
+        AND games.game_date BETWEEN ? AND ?
+        AND NOT EXISTS (
+            SELECT
+                1
+            FROM game_shot_charts
+            WHERE
+                game_shot_charts.game_id = games.id
+        )
+    """
+    df = readQuery(connection,query,[league_id,start,end])
+    return df['game_id'].to_list(), []
 
-UNION ALL
+def checkShotEvents(connection,league_id,start,end):
+    # Does every shot point at a made or missed shot event in game_events?
+    query = """
+    SELECT
+        games.id AS game_id,
+        COUNT(*) AS unmatched_shots
+    FROM games
+    INNER JOIN game_shot_charts
+        ON games.id = game_shot_charts.game_id
+    WHERE
+        games.league_id = ?
+        AND games.game_date BETWEEN ? AND ?
+        AND game_shot_charts.game_events_id IS NULL
+    GROUP BY
+        games.id
+    """
+    df = readQuery(connection,query,[league_id,start,end])
+    return df['game_id'].to_list(), df.to_dict('records')
 
-SELECT
-    'game_events' AS data_source,
-    SUM(
-        CASE WHEN event_message_type = 1 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%3PT%' THEN 3
-        WHEN event_message_type = 1 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE '%3PT%' THEN 2
-        WHEN event_message_type = 3 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%' THEN 1
-        ELSE 0 END
-    ) AS score
-FROM game_events
-"""
-print(readQuery(db_name,query,[]))
+def checkScores(connection,league_id,start,end):
+    # Does the sum of scores in the game_team_stats equal the sum of scores in the game_events?
+    # the descriptions come from the game_event_details view
+    # G League free throws are a single shot worth what the original shot was (1PT, 2PT or 3PT in the description)
+    # except in the last 2 minutes where they are normal free throws without a PT in the description
+    # the descriptions are only concatenated once per event and only for made shots and free throws
+    query = """
+    WITH events AS
+    (
+        SELECT
+            game_event_details.game_id,
+            games.league_id,
+            game_event_details.event_message_type,
+            COALESCE(game_event_details.home_description,'') || COALESCE(game_event_details.visitor_description,'') AS description
+        FROM games
+        INNER JOIN game_event_details
+            ON games.id = game_event_details.game_id
+        WHERE
+            games.league_id = ?
+            AND games.game_date BETWEEN ? AND ?
+            AND game_event_details.event_message_type IN (1,3)
+    ),
+    game_events_cte AS
+    (
+        SELECT
+            game_id,
+            SUM(
+                CASE
+                    WHEN event_message_type = 1 AND description LIKE '%3PT%' THEN 3
+                    WHEN event_message_type = 1 THEN 2
+                    WHEN description LIKE 'MISS%' THEN 0
+                    WHEN league_id <> '20' THEN 1
+                    WHEN description LIKE '%1PT%' THEN 1
+                    WHEN description LIKE '%2PT%' THEN 2
+                    WHEN description LIKE '%3PT%' THEN 3
+                    ELSE 1
+                END
+            ) AS score
+        FROM events
+        GROUP BY
+            game_id
+    ),
+    game_team_stats_cte AS
+    (
+        SELECT
+            game_team_stats.game_id,
+            SUM(game_team_stats.pts) AS score
+        FROM games
+        INNER JOIN game_team_stats
+            ON games.id = game_team_stats.game_id
+        WHERE
+            games.league_id = ?
+            AND games.game_date BETWEEN ? AND ?
+        GROUP BY
+            game_team_stats.game_id
+    )
+    SELECT
+        game_team_stats_cte.game_id,
+        game_team_stats_cte.score AS gts_score,
+        COALESCE(game_events_cte.score,0) AS ge_score
+    FROM game_team_stats_cte
+    LEFT JOIN game_events_cte
+        ON game_team_stats_cte.game_id = game_events_cte.game_id
+    WHERE
+        game_team_stats_cte.score <> COALESCE(game_events_cte.score,0)
+    """
+    df = readQuery(connection,query,[league_id,start,end,league_id,start,end])
+    return df['game_id'].to_list(), df.to_dict('records')
 
-# THE ABOVE CHECK IS A LITTLE OFF???
-# AFTER LOOKING SOME FT ATTEMPTS IN G LEAGUE SAY 2 OR 3 PTS???
-# https://bleacherreport.com/articles/2855449-g-league-to-test-single-free-throw-worth-1-2-or-3-points-depending-on-shot
-# AAAAHHHH - really didn't know about that rule change
-# See below for updated logic for g league free throws
-query = """
-SELECT
-    'game_team_stats' AS data_source,
-    sum(pts) AS score
-FROM game_team_stats
+def checkLineups(connection,league_id,start,end):
+    # Does every game have lineups for both teams with five players on the floor the whole game?
+    query = """
+    SELECT
+        games.id AS game_id,
+        COUNT(DISTINCT game_lineups.team_id) AS team_count,
+        SUM(CASE WHEN game_lineups.player_5_id IS NULL THEN 1 ELSE 0 END) AS short_stints
+    FROM games
+    LEFT JOIN game_lineups
+        ON games.id = game_lineups.game_id
+    WHERE
+        games.league_id = ?
+        AND games.game_date BETWEEN ? AND ?
+    GROUP BY
+        games.id
+    HAVING
+        COUNT(DISTINCT game_lineups.team_id) <> 2
+        OR SUM(CASE WHEN game_lineups.player_5_id IS NULL THEN 1 ELSE 0 END) > 0
+    """
+    df = readQuery(connection,query,[league_id,start,end])
+    return df['game_id'].to_list(), df.to_dict('records')
 
-UNION ALL
+checks = {
+    'team_count':checkTeamCount,
+    'game_team_stats':checkGameTeamStats,
+    'game_events':checkGameEvents,
+    'game_shot_charts':checkGameShotCharts,
+    'shot_events':checkShotEvents,
+    'scores':checkScores,
+    'lineups':checkLineups,
+}
 
-SELECT
-    'game_events' AS data_source,
-    SUM(
-        CASE
-            WHEN event_message_type = 1
-                AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%3PT%' THEN 3
-            WHEN event_message_type = 1
-                AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE '%3PT%' THEN 2
-            WHEN event_message_type = 3
-                AND league_id <> '20'
-                AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%' THEN 1
-            WHEN event_message_type = 3
-                 AND league_id = '20'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%1PT%'THEN 1
-            WHEN event_message_type = 3
-                 AND league_id = '20'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%2PT%'THEN 2
-            WHEN event_message_type = 3
-                 AND league_id = '20'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%3PT%'THEN 3
-        ELSE 0 END
-    ) AS score
-FROM game_events
-INNER JOIN games
-    ON game_events.game_id = games.id
-"""
-print(readQuery(db_name,query,[]))
+def runCheck(db_name,check_name,league_id,start,end):
+    # each check gets its own connection so they can run in parallel threads
+    with closing(connect(db_name)) as connection:
+        game_ids, details = checks[check_name](connection,league_id,start,end)
+    return [check_name,len(game_ids) == 0 and len(details) == 0,game_ids,details]
 
-# Closer, but not quite, here is a list of games that is off
-query = """
-WITH game_team_stats_cte AS
-(
-    SELECT
-        game_id,
-        'game_team_stats' AS data_source,
-        sum(pts) AS score
-    FROM game_team_stats
-    GROUP BY
-        game_id
-),
-game_events_cte AS
-(
-    SELECT
-        game_id,
-        'game_events' AS data_source,
-        SUM(
-            CASE
-                WHEN event_message_type = 1
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%3PT%' THEN 3
-                WHEN event_message_type = 1
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE '%3PT%' THEN 2
-                WHEN event_message_type = 3
-                    AND league_id <> '20'
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%' THEN 1
-                WHEN event_message_type = 3
-                    AND league_id = '20'
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%1PT%'THEN 1
-                WHEN event_message_type = 3
-                    AND league_id = '20'
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%2PT%'THEN 2
-                WHEN event_message_type = 3
-                    AND league_id = '20'
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                    AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%3PT%'THEN 3
-            ELSE 0 END
-        ) AS score
-    FROM game_events
-    INNER JOIN games
-        ON game_events.game_id = games.id
-    GROUP BY
-        game_id
-)
-SELECT
-    game_team_stats_cte.game_id,
-    games.league_id,
-    game_team_stats_cte.score AS gts_score,
-    game_events_cte.score AS ge_score
-FROM game_team_stats_cte
-INNER JOIN game_events_cte
-    ON game_team_stats_cte.game_id = game_events_cte.game_id
-INNER JOIN games
-    ON game_team_stats_cte.game_id = games.id
-WHERE
-    game_team_stats_cte.score <> game_events_cte.score
+def runChecks(db_name,league_id,start,end):
+    # runs every check at once and saves the results to the data_quality_results table
+    run_time = datetime.now().isoformat(timespec='seconds')
+    with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        results = list(executor.map(lambda check_name: runCheck(db_name,check_name,league_id,start,end),checks))
 
-"""
-print(readQuery(db_name,query,[]))
+    query = """
+    INSERT INTO data_quality_results
+    (run_time,check_name,league_id,start_date,end_date,passed,game_ids,details)
+    VALUES
+    (?,?,?,?,?,?,?,?);
+    """
+    with closing(connect(db_name)) as connection:
+        connection.executemany(query,[[run_time,check_name,league_id,start,end,passed,json.dumps(game_ids),json.dumps(details,default=str)] for check_name, passed, game_ids, details in results])
+        connection.commit()
 
-# There is one NBA game and 6 G League games...
-query = """
-SELECT
-    game_id,
-    event_number,
-    COUNT(*) AS event_count
-FROM game_events
-GROUP BY
-    game_id,
-    event_number
-HAVING
-    COUNT(*) > 1
-"""
-print(readQuery(db_name,query,[]))
+    for check_name, passed, game_ids, details in results:
+        logger.info('%s %s %s',check_name,'PASS' if passed else 'FAIL',game_ids)
+    return results
 
-# THE NBA GAME IS A DUPLICATE EVENT NUMBER - SHOULD DELETE ONE
-# THE G LEAGUE GAMES NOT SURE YET....
-# LOOKS LIKE IN THE LAST 2 MINUTES OF THE GAME THEY DO NORMAL FTS
-# IN THE BOX SCORE THAT DOESN'T SHOW AS 1PT... NEED TO UPDATE CASE STATEMENT
 
-query = """
-SELECT
-    'game_team_stats' AS data_source,
-    sum(pts) AS score
-FROM game_team_stats
+if __name__ == '__main__':
+    args = parseArguments()
+    logging.basicConfig(level='INFO',format='%(asctime)s %(levelname)s %(message)s')
 
-UNION ALL
+    start = args.ds
+    end = args.ds
+    if args.start is not None:
+        start = args.start
+        end = args.end
 
-SELECT
-    'game_events' AS data_source,
-    SUM(
-        CASE
-            WHEN event_message_type = 1
-                AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%3PT%' THEN 3
-            WHEN event_message_type = 1
-                AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE '%3PT%' THEN 2
-            WHEN event_message_type = 3
-                AND league_id <> '20'
-                AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%' THEN 1
-            WHEN event_message_type = 3
-                 AND league_id = '20'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%1PT%'THEN 1
-            WHEN event_message_type = 3
-                 AND league_id = '20'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%2PT%'THEN 2
-            WHEN event_message_type = 3
-                 AND league_id = '20'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) LIKE '%3PT%'THEN 3
-            WHEN event_message_type = 3
-                 AND league_id = '20'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE 'MISS%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE '%1PT%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE '%2PT%'
-                 AND (COALESCE(home_description,'') || COALESCE(visitor_description,'')) NOT LIKE '%3PT%' THEN 1
-        ELSE 0 END
-    ) AS score
-FROM game_events
-INNER JOIN games
-    ON game_events.game_id = games.id
-"""
-print(readQuery(db_name,query,[]))
+    db_name = args.db
+    with closing(connect(db_name)) as connection:
+        league_id = connection.execute('SELECT id FROM leagues WHERE league_name = ?;',[args.league]).fetchone()[0]
 
-# AWESOME THAT DID IT!!!! NOW ONLY OFF BY THE 3 PTS THAT IS A DUPLICATE
+    runChecks(db_name,league_id,start.isoformat(),end.isoformat())
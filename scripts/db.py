@@ -1,20 +1,16 @@
-import sqlite3
+import argparse
 from contextlib import closing
 from os.path import exists
 from os import remove
+from backend import connect, runQueries
 
-db_name = './assets/data/nba_stats.db'
 
-if exists(db_name):
-    remove(db_name)
-
-def runQueries(db_name,query_list):
-    with closing(sqlite3.connect(db_name)) as connection:
-        with connection:
-            with closing(connection.cursor()) as cursor:
-                for query in query_list:
-                    print(query)
-                    cursor.execute(query)
+def parseArguments():
+    # argparse to get which database to create
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-db',help='database file to create, a .duckdb file creates the DuckDB analytical copy',default='./assets/data/nba_stats.db')
+    args = parser.parse_args()
+    return args
 
 
 query_list = [
@@ -172,12 +168,54 @@ CREATE TABLE game_team_stats
 );
 """,
 """
+/*
+    This is manually inserted at the bottom of this script
+    The event types of the play by play, the ETL adds any new ones it finds without a name
+*/
+CREATE TABLE event_message_types
+(
+    id INTEGER PRIMARY KEY,
+    event_message_type_name TEXT
+);
+""",
+"""
+/*
+    The action types of each event type in the play by play (i.e. jump shot or layup for a made shot)
+    It is filled in by the ETL as it finds them, action_type_name comes from the shotchartdetail endpoint
+    so only the shot action types have a name
+*/
+CREATE TABLE event_message_action_types
+(
+    id INTEGER PRIMARY KEY,
+    event_message_type INTEGER,
+    event_message_action_type INTEGER,
+    action_type_name TEXT,
+    FOREIGN KEY (event_message_type) REFERENCES event_message_types(id)
+);
+""",
+"""
+/*
+    Every distinct description in the play by play is stored once here
+    and game_events points at it by id
+    The id is the first 63 bits of the sha256 hash of the description (set by the ETL)
+    so it needs 64 bit integers, SQLite's INTEGER is and DuckDB copies get BIGINT
+*/
+CREATE TABLE event_descriptions
+(
+    id INTEGER PRIMARY KEY,
+    description TEXT
+);
+""",
+"""
 /*
     This table holds the play by play of the game
     It is a pretty cool table
-    One future improvement:
-        create an enum of event_message type and action_type
     It sources from the playbyplayv2 endpoint
+    It is stored compact since it is the biggest table:
+        clock_seconds is the play clock as seconds left in the period
+        the descriptions are ids of the event_descriptions table
+        home_score and away_score are only set on scoring events like the score from the api
+    The game_event_details view has the original text columns
 */
 CREATE TABLE game_events
 (
@@ -187,12 +225,12 @@ CREATE TABLE game_events
     event_message_type INTEGER,
     event_message_action_type INTEGER,
     period INTEGER,
-    play_clock TEXT,
-    home_description TEXT,
-    neutral_description TEXT,
-    visitor_description TEXT,
-    score VARCHAR,
-    score_margin INTEGER,
+    clock_seconds INTEGER,
+    home_description_id BIGINT,
+    neutral_description_id BIGINT,
+    visitor_description_id BIGINT,
+    home_score INTEGER,
+    away_score INTEGER,
     person_1_type INTEGER,
     person_1_id INTEGER,
     person_1_team_id INTEGER,
@@ -203,6 +241,10 @@ CREATE TABLE game_events
     person_3_id INTEGER,
     person_3_team_id INTEGER,
     FOREIGN KEY (game_id) REFERENCES games(id),
+    FOREIGN KEY (event_message_type) REFERENCES event_message_types(id),
+    FOREIGN KEY (home_description_id) REFERENCES event_descriptions(id),
+    FOREIGN KEY (neutral_description_id) REFERENCES event_descriptions(id),
+    FOREIGN KEY (visitor_description_id) REFERENCES event_descriptions(id),
     FOREIGN KEY (person_1_id) REFERENCES players(id),
     FOREIGN KEY (person_1_team_id) REFERENCES teams(id),
     FOREIGN KEY (person_2_id) REFERENCES players(id),
@@ -215,12 +257,17 @@ CREATE TABLE game_events
 /*
     This table holds the shot details from each game
     It sources from the shotchartdetail endpoint
+    game_events_id is the shot's event in game_events, resolved by the ETL from the game_id and event number when it loads the game
+    so joins to game_events are primary key lookups, it is NULL when the play by play has no made or missed shot with the shot's event number
+    league_id and season_id are copied from the game and the cell columns are the square (grid) and hexagon (hex) bins of the shot
+    at bin sizes of 10 and 30 or 15 and 30 tenths of a foot (see shot_cells.py), NULL when the shot is off the half court
 */
 CREATE TABLE game_shot_charts
 (
     id INTEGER PRIMARY KEY,
     game_id TEXT,
     game_events_event_number INTEGER,
+    game_events_id INTEGER,
     player_id INTEGER,
     team_id INTEGER,
     period INTEGER,
@@ -237,16 +284,276 @@ CREATE TABLE game_shot_charts
     loc_y INTEGER,
     shot_attempted_flag INTEGER,
     shot_made_flag INTEGER,
+    league_id TEXT,
+    season_id INTEGER,
+    grid_10_cell INTEGER,
+    grid_30_cell INTEGER,
+    hex_15_cell INTEGER,
+    hex_30_cell INTEGER,
     FOREIGN KEY (game_id) REFERENCES games(id),
-    FOREIGN KEY (game_events_event_number) REFERENCES game_play_by_play_events(event_number)
+    FOREIGN KEY (game_events_id) REFERENCES game_events(id),
+    FOREIGN KEY (league_id) REFERENCES leagues(id),
+    FOREIGN KEY (season_id) REFERENCES seasons(id)
 );
 """,
 """
+/*
+    This table holds the five players of each team on the floor for every stretch of game_events between substitutions
+    The ETL builds it from the substitutions in the play by play (event_message_type 8, person 1 goes out and person 2 comes in)
+    and the players in each period's events before they are subbed in (the api doesn't list who starts a period)
+    The stint covers the game_events from start_event_number through end_event_number of the period
+    The players are in id order so the same five players are always the same lineup, a player that couldn't be found is NULL
+*/
+CREATE TABLE game_lineups
+(
+    id INTEGER PRIMARY KEY,
+    game_id TEXT,
+    team_id INTEGER,
+    period INTEGER,
+    start_event_number INTEGER,
+    end_event_number INTEGER,
+    seconds INTEGER,
+    player_1_id INTEGER,
+    player_2_id INTEGER,
+    player_3_id INTEGER,
+    player_4_id INTEGER,
+    player_5_id INTEGER,
+    FOREIGN KEY (game_id) REFERENCES games(id),
+    FOREIGN KEY (team_id) REFERENCES teams(id),
+    FOREIGN KEY (player_1_id) REFERENCES players(id),
+    FOREIGN KEY (player_2_id) REFERENCES players(id),
+    FOREIGN KEY (player_3_id) REFERENCES players(id),
+    FOREIGN KEY (player_4_id) REFERENCES players(id),
+    FOREIGN KEY (player_5_id) REFERENCES players(id)
+);
+""",
+"""
+/*
+    This table has the field goal attempts and makes of each player by shot zone
+    It is unique at the player_id, league_id, season_id, season_type_id and shot zone level
+    The ETL subtracts the shots of a date's games before reloading them and adds them back after
+*/
+CREATE TABLE player_shot_zones
+(
+    id INTEGER PRIMARY KEY,
+    player_id INTEGER,
+    league_id TEXT,
+    season_id INTEGER,
+    season_type_id INTEGER,
+    shot_zone_basic TEXT,
+    shot_zone_area TEXT,
+    shot_zone_range TEXT,
+    attempts INTEGER,
+    makes INTEGER,
+    FOREIGN KEY (player_id) REFERENCES players(id),
+    FOREIGN KEY (league_id) REFERENCES leagues(id),
+    FOREIGN KEY (season_id) REFERENCES seasons(id),
+    FOREIGN KEY (season_type_id) REFERENCES season_types(id)
+);
+""",
+"""
+/*
+    This table has the field goal attempts and makes of each team by shot zone
+    It is unique at the team_id, league_id, season_id, season_type_id and shot zone level
+    The ETL subtracts the shots of a date's games before reloading them and adds them back after
+*/
+CREATE TABLE team_shot_zones
+(
+    id INTEGER PRIMARY KEY,
+    team_id INTEGER,
+    league_id TEXT,
+    season_id INTEGER,
+    season_type_id INTEGER,
+    shot_zone_basic TEXT,
+    shot_zone_area TEXT,
+    shot_zone_range TEXT,
+    attempts INTEGER,
+    makes INTEGER,
+    FOREIGN KEY (team_id) REFERENCES teams(id),
+    FOREIGN KEY (league_id) REFERENCES leagues(id),
+    FOREIGN KEY (season_id) REFERENCES seasons(id),
+    FOREIGN KEY (season_type_id) REFERENCES season_types(id)
+);
+""",
+"""
+/*
+    This table holds the results of the checks in data_quality.py
+    Each row is one check for one league and date range
+    game_ids is a json list of the games that failed the check
+    details is a json list of the rows the check found
+*/
+CREATE TABLE data_quality_results
+(
+    id INTEGER PRIMARY KEY,
+    run_time DATETIME,
+    check_name TEXT,
+    league_id TEXT,
+    start_date DATE,
+    end_date DATE,
+    passed INTEGER,
+    game_ids TEXT,
+    details TEXT,
+    FOREIGN KEY (league_id) REFERENCES leagues(id)
+);
+""",
+"""
+/*
+    This table holds one row per league for every run of etl.py
+    status is success or failed, seconds is the wall time of the load
+    report is json with the seconds and count of each stage (summed over the threads)
+    and counters like api calls, bytes and cache hits per endpoint and rows written per table
+*/
+CREATE TABLE etl_runs
+(
+    id INTEGER PRIMARY KEY,
+    start_time DATETIME,
+    end_time DATETIME,
+    league_id TEXT,
+    start_date DATE,
+    end_date DATE,
+    status TEXT,
+    seconds REAL,
+    api_calls INTEGER,
+    api_bytes INTEGER,
+    rows_written INTEGER,
+    report TEXT,
+    FOREIGN KEY (league_id) REFERENCES leagues(id)
+);
+""",
+"""
+/*
+    This table holds a hash of the api data of every game from its last load
+    game_log_hash is the hash of its two leaguegamelog rows, play_by_play_hash of its playbyplayv2 rows
+    and shot_chart_hash of its shotchartdetail rows, reruns skip the games whose hashes are the same
+*/
+CREATE TABLE game_hashes
+(
+    game_id TEXT PRIMARY KEY,
+    game_log_hash TEXT,
+    play_by_play_hash TEXT,
+    shot_chart_hash TEXT,
+    load_time DATETIME,
+    FOREIGN KEY (game_id) REFERENCES games(id)
+);
+""",
+"""
+/*
+    The ETL upserts into these tables with INSERT ... ON CONFLICT
+    so these unique indexes are the natural keys of each table
+    game_events had a duplicate event (game 0022100166 event 177), this keeps only one
+*/
+CREATE UNIQUE INDEX league_season_teams_league_season_team ON league_season_teams (league_id, season_id, team_id);
+""",
+"""
+CREATE UNIQUE INDEX game_team_stats_game_team ON game_team_stats (game_id, team_id);
+""",
+"""
+CREATE UNIQUE INDEX game_events_game_event_number ON game_events (game_id, event_number);
+""",
+"""
+CREATE UNIQUE INDEX event_message_action_types_type_action_type ON event_message_action_types (event_message_type, event_message_action_type);
+""",
+"""
+CREATE UNIQUE INDEX game_shot_charts_game_event_number ON game_shot_charts (game_id, game_events_event_number);
+""",
+"""
+/*
+    Spatial filters (a set of cells) and heatmaps (grouped by cell) of a season, team or player are range scans on these indexes
+*/
+CREATE INDEX game_shot_charts_grid_10_cell ON game_shot_charts (grid_10_cell, league_id, season_id, team_id, player_id);
+""",
+"""
+CREATE INDEX game_shot_charts_grid_30_cell ON game_shot_charts (grid_30_cell, league_id, season_id, team_id, player_id);
+""",
+"""
+CREATE INDEX game_shot_charts_hex_15_cell ON game_shot_charts (hex_15_cell, league_id, season_id, team_id, player_id);
+""",
+"""
+CREATE INDEX game_shot_charts_hex_30_cell ON game_shot_charts (hex_30_cell, league_id, season_id, team_id, player_id);
+""",
+"""
+/*
+    The lineup of an event is a range lookup on this index (start_event_number <= event_number and end_event_number >= event_number)
+*/
+CREATE UNIQUE INDEX game_lineups_game_team_event_number ON game_lineups (game_id, team_id, start_event_number, end_event_number);
+""",
+"""
+CREATE UNIQUE INDEX player_shot_zones_player_season_zone ON player_shot_zones (player_id, league_id, season_id, season_type_id, shot_zone_basic, shot_zone_area, shot_zone_range);
+""",
+"""
+CREATE UNIQUE INDEX team_shot_zones_team_season_zone ON team_shot_zones (team_id, league_id, season_id, season_type_id, shot_zone_basic, shot_zone_area, shot_zone_range);
+""",
+"""
+/*
+    Each ETL run looks up the games of a league on a date
+*/
+CREATE INDEX games_league_season_type_date ON games (league_id, season_id, season_type_id, game_date);
+""",
+"""
 INSERT INTO season_types (id, season_type_name) VALUES (1,'Pre Season'),(2,'Regular Season'),(4,'Playoffs'),(5,'Showcase');
 """,
 """
 INSERT INTO leagues (id, league_name) VALUES ('00','NBA'),('10','WNBA'),('20','GLEAGUE')
 """,
+"""
+INSERT INTO event_message_types (id, event_message_type_name) VALUES (1,'Made Shot'),(2,'Missed Shot'),(3,'Free Throw'),(4,'Rebound'),(5,'Turnover'),(6,'Foul'),(7,'Violation'),(8,'Substitution'),(9,'Timeout'),(10,'Jump Ball'),(11,'Ejection'),(12,'Start of Period'),(13,'End of Period'),(18,'Instant Replay');
+""",
+"""
+/*
+    game_events with the play clock, descriptions, score and score margin as the text the api sends
+*/
+CREATE VIEW game_event_details AS
+SELECT
+    game_events.id,
+    game_events.game_id,
+    game_events.event_number,
+    game_events.event_message_type,
+    event_message_types.event_message_type_name,
+    game_events.event_message_action_type,
+    event_message_action_types.action_type_name,
+    game_events.period,
+    CASE WHEN game_events.clock_seconds IS NOT NULL THEN printf('%d:%02d',CAST((game_events.clock_seconds - game_events.clock_seconds % 60) / 60 AS INTEGER),game_events.clock_seconds % 60) END AS play_clock,
+    home_descriptions.description AS home_description,
+    neutral_descriptions.description AS neutral_description,
+    visitor_descriptions.description AS visitor_description,
+    CASE WHEN game_events.home_score IS NOT NULL THEN CAST(game_events.away_score AS TEXT) || ' - ' || CAST(game_events.home_score AS TEXT) END AS score,
+    CASE WHEN game_events.home_score IS NULL THEN NULL
+         WHEN game_events.home_score = game_events.away_score THEN 'TIE'
+         ELSE CAST(game_events.home_score - game_events.away_score AS TEXT)
+    END AS score_margin,
+    game_events.home_score,
+    game_events.away_score,
+    game_events.person_1_type,
+    game_events.person_1_id,
+    game_events.person_1_team_id,
+    game_events.person_2_type,
+    game_events.person_2_id,
+    game_events.person_2_team_id,
+    game_events.person_3_type,
+    game_events.person_3_id,
+    game_events.person_3_team_id
+FROM game_events
+LEFT JOIN event_message_types
+    ON game_events.event_message_type = event_message_types.id
+LEFT JOIN event_message_action_types
+    ON game_events.event_message_type = event_message_action_types.event_message_type
+    AND game_events.event_message_action_type = event_message_action_types.event_message_action_type
+LEFT JOIN event_descriptions AS home_descriptions
+    ON game_events.home_description_id = home_descriptions.id
+LEFT JOIN event_descriptions AS neutral_descriptions
+    ON game_events.neutral_description_id = neutral_descriptions.id
+LEFT JOIN event_descriptions AS visitor_descriptions
+    ON game_events.visitor_description_id = visitor_descriptions.id;
+""",
 ]
 
-runQueries(db_name,query_list)
+if __name__ == '__main__':
+    db_name = parseArguments().db
+
+    # the -wal and -shm files of a SQLite database in WAL mode go with it
+    for file_name in [db_name,f'{db_name}-wal',f'{db_name}-shm',f'{db_name}.wal']:
+        if exists(file_name):
+            remove(file_name)
+
+    with closing(connect(db_name)) as connection:
+        runQueries(connection,query_list)
@@ -1,20 +1,83 @@
 import argparse
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 import json
-import sqlite3
-from contextlib import closing
+import hashlib
+import logging
+import os
+import re
+from operator import itemgetter
+from contextlib import closing, contextmanager
+from functools import wraps
+from itertools import groupby
 import pandas as pd
 import requests
-from time import sleep
-from random import randint
+from requests.adapters import HTTPAdapter
+from random import uniform
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock, get_ident
+from time import sleep, monotonic, time
+from urllib.parse import urlsplit
+from backend import connect
+from shot_cells import cell_columns, getShotCells
+from data_quality import runChecks
 
+logger = logging.getLogger('etl')
+
+
+def positiveInt(value):
+    # argparse type for counts that have to be at least 1
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not 1 or more')
+    return number
+
+def nonNegativeInt(value):
+    # argparse type for counts that can be 0
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f'{value} is not 0 or more')
+    return number
+
+def positiveFloat(value):
+    # argparse type for rates that have to be more than 0
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f'{value} is not more than 0')
+    return number
 
 def parseArguments():
     # argparse to get the ds the run
     parser = argparse.ArgumentParser()
-    parser.add_argument('-ds',help='date used to run etl (YYYY-MM-DD)',type=date.fromisoformat,default=date.today() - timedelta(1))
-    parser.add_argument('-league',help='league used to run etl (NBA,WNBA,GLEAGUE)',choices=['NBA','WNBA','GLEAGUE'],default='NBA')
+    parser.add_argument('-ds',help='date used to run etl (YYYY-MM-DD), defaults to the prior day',type=date.fromisoformat)
+    parser.add_argument('-start',help='first date of a backfill (YYYY-MM-DD), runs every date through -end instead of -ds',type=date.fromisoformat)
+    parser.add_argument('-end',help='last date of a backfill (YYYY-MM-DD), defaults to the prior day',type=date.fromisoformat)
+    parser.add_argument('-league',help='leagues used to run etl (NBA,WNBA,GLEAGUE), more than one league runs them at the same time in separate processes',choices=['NBA','WNBA','GLEAGUE'],nargs='+',default=['NBA'])
+    parser.add_argument('-rps',help='max number of api requests per second across all workers, split evenly between the leagues when more than one runs at once',type=positiveFloat,default=1.0)
+    parser.add_argument('-workers',help='number of api requests that can be in flight at once',type=positiveInt,default=4)
+    parser.add_argument('-retries',help='times a request is retried after a timeout, connection error, 429 or 5xx',type=nonNegativeInt,default=5)
+    parser.add_argument('-cache_dir',help='directory the api responses are cached in',default='./assets/data/api_cache')
+    parser.add_argument('-cache_ttl',help='hours a cached api response is used before calling the api again',type=float,default=24.0)
+    parser.add_argument('-cache_size',help='max size of the api response cache in MB, oldest responses are removed first',type=float,default=1024.0)
+    parser.add_argument('-data_quality',help='run the data quality checks on the loaded dates after the load',action='store_true')
+    parser.add_argument('-export_dir',help='also write the loaded game_events and game_shot_charts to partitioned parquet files in this directory (needs pyarrow)')
+    parser.add_argument('-duckdb',help='also copy the loaded dates to this DuckDB database (create it with db.py -db <file>.duckdb)')
+    parser.add_argument('-log_level',help='DEBUG also logs every api call and sql query',choices=['DEBUG','INFO','WARNING'],default='INFO')
+    parser.add_argument('-base_url',help='url the api endpoints are under, point it at server.py to run against the local stand-in api',default='https://stats.nba.com/stats')
+    parser.add_argument('-reload',help='call the api (not the response cache) for every game, even the ones whose game log hashes the same as the last load, games whose api data all hashes the same are still skipped',action='store_true')
+    parser.add_argument('-chunk_days',help='load a backfill this many days at a time, so only one chunk of game logs is held in memory instead of a whole season',type=positiveInt)
+    parser.add_argument('-chunk_games',help='fetch the play by play of a date this many games at a time, each chunk is made into game_events rows before the next is fetched',type=positiveInt)
+    parser.add_argument('-offline',help='only use cached api responses, never call the api',action='store_true')
     args = parser.parse_args()
+
+    # -ds is one date and -start/-end a range, a mix of them or an empty range would load nothing and still save a successful run
+    if args.start is None and args.end is not None:
+        parser.error('-end needs -start')
+    if args.start is not None and args.ds is not None:
+        parser.error('use -ds or -start/-end, not both')
+    args.ds = args.ds or date.today() - timedelta(1)
+    args.end = args.end or date.today() - timedelta(1)
+    if args.start is not None and args.start > args.end:
+        parser.error(f'-start {args.start} is after -end {args.end}')
     return args
 
 def getSeason(ds,league_name):
@@ -25,10 +88,181 @@ def getSeason(ds,league_name):
     ds_season = str(ds_year) + '-' + str(ds_year+1)[-2:]
     return ds_season
 
-def getData(url,params):
-    # headers for calling the api
+class RateLimiter:
+    # token bucket shared by all threads so together they stay under requests_per_second
+    # the rate is halved when the api pushes back (429 or 5xx) and climbs back up with each success
+    def __init__(self,requests_per_second,burst=1):
+        self.max_rate = requests_per_second
+        self.min_rate = requests_per_second / 16
+        self.rate = requests_per_second
+        self.burst = burst
+        self.tokens = burst
+        self.last_time = monotonic()
+        self.lock = Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.burst,self.tokens + (now - self.last_time) * self.rate)
+                self.last_time = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            sleep(wait_time)
+
+    def slowDown(self):
+        with self.lock:
+            self.rate = max(self.min_rate,self.rate / 2)
+            logger.warning('api rate lowered to %.2f requests per second',self.rate)
+
+    def speedUp(self):
+        with self.lock:
+            self.rate = min(self.max_rate,self.rate + self.max_rate / 10)
+
+class RunStats:
+    # seconds spent in each stage and counters for a run, shared by all threads
+    # stage seconds are summed over the threads, so the api stages can add up to more than the run took
+    def __init__(self):
+        self.start_time = monotonic()
+        self.stages = {}
+        self.counters = {}
+        self.lock = Lock()
+
+    @contextmanager
+    def timer(self,stage):
+        stage_start = monotonic()
+        try:
+            yield
+        finally:
+            seconds = monotonic() - stage_start
+            with self.lock:
+                stage_seconds, stage_count = self.stages.get(stage,(0.0,0))
+                self.stages[stage] = (stage_seconds + seconds,stage_count + 1)
+
+    def add(self,counter,value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter,0) + value
+
+    def getTotal(self,prefix):
+        # sum of the counters starting with prefix, like every api_calls.<endpoint>
+        with self.lock:
+            return sum(value for counter, value in self.counters.items() if counter.startswith(prefix))
+
+    def getReport(self):
+        with self.lock:
+            return {
+                'seconds':round(monotonic() - self.start_time,3),
+                'stages':{stage:{'seconds':round(seconds,3),'count':count} for stage, (seconds, count) in sorted(self.stages.items())},
+                'counters':dict(sorted(self.counters.items())),
+            }
+
+def timed(stage):
+    # decorator that adds the time spent in a function to a stage of run_stats
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args,**kwargs):
+            with run_stats.timer(stage):
+                return function(*args,**kwargs)
+        return wrapper
+    return decorator
+
+class ResponseCache:
+    # stores the raw api responses on disk, named by a hash of the url and params
+    def __init__(self,cache_dir,ttl_hours,max_size_mb,offline=False):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_hours * 60 * 60
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.offline = offline
+        os.makedirs(cache_dir,exist_ok=True)
+
+    def getPath(self,url,params):
+        # params are sorted and turned to strings so {'a':1} and {'a':'1'} share an entry
+        key = json.dumps([url,sorted((str(k),str(v)) for k,v in params.items())])
+        return os.path.join(self.cache_dir,hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+    def get(self,url,params):
+        path = self.getPath(url,params)
+        if not os.path.exists(path):
+            if self.offline:
+                raise FileNotFoundError(f'{url} {params} is not in the cache and running offline')
+            return None
+        # offline runs use whatever is in the cache no matter how old
+        if not self.offline and time() - os.path.getmtime(path) > self.ttl_seconds:
+            return None
+        with open(path,'rb') as f:
+            return f.read()
+
+    def put(self,url,params,content):
+        path = self.getPath(url,params)
+        # write to a temp file first so other threads never read half a file
+        temp_path = f'{path}.{os.getpid()}.{get_ident()}.tmp'
+        with open(temp_path,'wb') as f:
+            f.write(content)
+        os.replace(temp_path,path)
+
+    def evict(self):
+        # remove the oldest responses until the cache fits in max_size_bytes
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime,stat.st_size,entry.path))
+        cache_size = sum(size for _,size,_ in entries)
+        for _,size,path in sorted(entries):
+            if cache_size <= self.max_size_bytes:
+                break
+            os.remove(path)
+            cache_size -= size
+
+def getSession(pool_size):
+    # one keep-alive connection per worker thread, reused for every request
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1,pool_maxsize=pool_size)
+    session.mount('https://',adapter)
+    session.mount('http://',adapter)
+    return session
+
+def getBackoff(attempt):
+    # exponential backoff with full jitter so the threads don't all retry at once
+    return uniform(0,min(60,2 ** attempt))
+
+# seconds to wait on each endpoint, the play by play and shot charts are the big payloads
+endpoint_timeouts = {
+    'playbyplayv2':60,
+    'shotchartdetail':120,
+}
+default_timeout = 30
+
+# leaguegamelog decides which games are reloaded, so it is always read from the api (its response is still cached for -offline runs)
+uncached_endpoints = {'leaguegamelog'}
+
+# shared by every getData call, overwritten from the arguments when run as a script
+base_url = 'https://stats.nba.com/stats'
+rate_limiter = RateLimiter(1.0)
+max_workers = 4
+max_retries = 5
+session = getSession(max_workers)
+response_cache = None
+run_stats = RunStats()
+
+def decodeResponse(url,params,content):
+    # the api sometimes answers 200 with a page or error that isn't json result sets, that raises here instead of being used or cached
+    with run_stats.timer('json_decode'):
+        try:
+            payload = json.loads(content)
+        except ValueError:
+            payload = None
+    if not isinstance(payload,dict) or not payload.get('resultSets'):
+        raise ValueError(f'{url} {params} did not return resultSets: {content[:200]!r}')
+    return payload
+
+def getResponse(url,params,refresh=False):
+    # returns the decoded json of the api response, from the cache when it's there unless refresh is set
+    # headers for calling the api, requests sets the Host from the url and the Referer is the site of -base_url
+    # so a stand-in api behind a proxy or on another host gets its own name
     headers = {
-        'Host': 'stats.nba.com',
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:72.0) Gecko/20100101 Firefox/72.0',
         'Accept': 'application/json, text/plain, */*',
         'Accept-Language': 'en-US,en;q=0.5',
@@ -36,38 +270,151 @@ def getData(url,params):
         'x-nba-stats-origin': 'stats',
         'x-nba-stats-token': 'true',
         'Connection': 'keep-alive',
-        'Referer': 'https://stats.nba.com/',
+        'Referer': '{0.scheme}://{0.netloc}/'.format(urlsplit(base_url)),
         'Pragma': 'no-cache',
         'Cache-Control': 'no-cache',
     }
-    sleep(randint(1,5))
-    response = requests.get(url,params=params,headers=headers)
-    response_json = json.loads(response.content)
+    endpoint = url.rsplit('/',1)[-1]
+    content = None
+    # -reload skips the cache too, a cached response from earlier in the ttl would just reload the same data
+    use_cache = response_cache is not None and (response_cache.offline or not (refresh or reload_games or endpoint in uncached_endpoints))
+    if use_cache:
+        with run_stats.timer('api_cache'):
+            content = response_cache.get(url,params)
+        if content is not None:
+            run_stats.add(f'cache_hits.{endpoint}')
+
+    if content is None:
+        timeout = endpoint_timeouts.get(endpoint,default_timeout)
+        for attempt in range(max_retries + 1):
+            # api_wait is time spent sleeping for the rate limiter and backoff, api_request is time waiting on the api
+            with run_stats.timer('api_wait'):
+                rate_limiter.wait()
+            try:
+                with run_stats.timer('api_request'):
+                    response = session.get(url,params=params,headers=headers,timeout=timeout)
+            except (requests.ConnectionError,requests.Timeout) as error:
+                if attempt == max_retries:
+                    raise
+                logger.warning('%s %s failed (%s), retry %s',url,params,error,attempt + 1)
+                run_stats.add(f'api_retries.{endpoint}')
+                rate_limiter.slowDown()
+                with run_stats.timer('api_wait'):
+                    sleep(getBackoff(attempt))
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == max_retries:
+                    response.raise_for_status()
+                logger.warning('%s %s returned %s, retry %s',url,params,response.status_code,attempt + 1)
+                run_stats.add(f'api_retries.{endpoint}')
+                rate_limiter.slowDown()
+                retry_after = response.headers.get('Retry-After','')
+                with run_stats.timer('api_wait'):
+                    sleep(float(retry_after) if retry_after.isdigit() else getBackoff(attempt))
+                continue
+
+            # other errors like a 400 for bad params won't get better with a retry
+            response.raise_for_status()
+            rate_limiter.speedUp()
+            break
+
+        content = response.content
+        run_stats.add(f'api_calls.{endpoint}')
+        run_stats.add(f'api_bytes.{endpoint}',len(content))
+        # only responses that decode are cached, a bad one would otherwise fail every run until the ttl (or forever offline)
+        payload = decodeResponse(url,params,content)
+        if response_cache is not None:
+            with run_stats.timer('api_cache'):
+                response_cache.put(url,params,content)
+        return payload
 
-    headers = response_json['resultSets'][0]['headers']
-    rows = response_json['resultSets'][0]['rowSet']
+    return decodeResponse(url,params,content)
 
-    df = pd.DataFrame(rows, columns=headers).rename(str.lower,axis='columns')
-    print(df.head())
+def getRows(url,params,refresh=False):
+    # returns the lowercase headers and the rows of the first result set as the api sent them
+    result_set = getResponse(url,params,refresh)['resultSets'][0]
+    headers = [header.lower() for header in result_set['headers']]
+    rows = result_set['rowSet']
+    logger.debug('%s %s %s rows',url,params,len(rows))
+    return headers, rows
+
+def getData(url,params):
+    headers, rows = getRows(url,params)
+    with run_stats.timer('pandas'):
+        return pd.DataFrame(rows, columns=headers)
+
+def getManyData(url_params,get_function=getData):
+    # calls get_function for each (url,params) pair (or (url,params,refresh) for getRows) in parallel, results come back in the same order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda url_param: get_function(*url_param),url_params))
+
+def getManyDataChunks(url_params,chunk_size,get_function=getData):
+    # getManyData chunk_size pairs at a time, yields the results in the same order so only one chunk of responses is in memory
+    chunk_size = chunk_size or len(url_params) or 1
+    for chunk_start in range(0,len(url_params),chunk_size):
+        yield from getManyData(url_params[chunk_start:chunk_start + chunk_size],get_function)
+
+def selectColumns(headers,rows,columns):
+    # picks columns out of the rows from getRows by name, the tuples can go straight to executemany
+    get_columns = itemgetter(*[headers.index(column) for column in columns])
+    if len(columns) == 1:
+        return [(get_columns(row),) for row in rows]
+    return [get_columns(row) for row in rows]
+
+def getRowsCounter(query):
+    # rows_written.<table> for inserts and upserts, rows_deleted.<table> for deletes
+    action, table = re.search(r'(INSERT INTO|DELETE\s+FROM)\s+(\w+)',query).groups()
+    if action == 'INSERT INTO':
+        return f'rows_written.{table}'
+    return f'rows_deleted.{table}'
+
+def insertQuery(connection,query,values):
+    with closing(connection.cursor()) as cursor, run_stats.timer('sql_write'):
+        logger.debug(query)
+        cursor.execute(query,values)
+        run_stats.add(getRowsCounter(query),max(cursor.rowcount,0))
+
+def insertManyQuery(connection,query,values_list):
+    with closing(connection.cursor()) as cursor, run_stats.timer('sql_write'):
+        logger.debug(query)
+        cursor.executemany(query,values_list)
+        logger.debug('%s rows',cursor.rowcount)
+        run_stats.add(getRowsCounter(query),max(cursor.rowcount,0))
+
+@contextmanager
+def transaction(connection):
+    # like with connection:, commits when the block finishes or rolls back if it raises, but times the commit
+    try:
+        yield
+    except BaseException:
+        connection.rollback()
+        raise
+    with run_stats.timer('sql_commit'):
+        connection.commit()
+
+def getUpsertQuery(table,columns,key_columns):
+    # insert that updates the existing row on a key conflict, but only when one of the values changed
+    update_columns = [column for column in columns if column not in key_columns]
+    query = f"""
+    INSERT INTO {table}
+    ({','.join(columns)})
+    VALUES
+    ({','.join('?' for column in columns)})
+    ON CONFLICT ({','.join(key_columns)}) DO UPDATE SET
+        {', '.join(f'{column} = excluded.{column}' for column in update_columns)}
+    WHERE
+        {' OR '.join(f'{table}.{column} IS NOT excluded.{column}' for column in update_columns)};
+    """
+    return query
 
+def readQuery(connection,query,values):
+    with run_stats.timer('sql_read'):
+        df = pd.read_sql_query(sql=query, con=connection, params=values)
+    logger.debug('%s\n%s',query,df)
     return df
 
-def insertQuery(db_name,query,values):
-    with closing(sqlite3.connect(db_name)) as connection:
-        with connection:
-            with closing(connection.cursor()) as cursor:
-                print(query)
-                cursor.execute(query,values)
-
-def readQuery(db_name,query,values):
-    with closing(sqlite3.connect(db_name)) as connection:
-        with connection:
-            df = pd.read_sql_query(sql=query, con=connection, params=values)
-            print(query)
-            print(df.head())
-            return df
-
-def getID(db_name,table,field,value):
+def getID(connection,table,field,value):
     query = f"""
     SELECT
         id
@@ -75,34 +422,34 @@ def getID(db_name,table,field,value):
     WHERE
         {field} = ?;
     """
-    values = (table,field,value)
-    with closing(sqlite3.connect(db_name)) as connection:
-        with connection:
-            df = pd.read_sql_query(sql=query, con=connection, params=[value])
-            print(query)
-            print(df.head())
-            return df['id'][0]
-
-def insertYear(db_name,season_id,season_name):
+    df = pd.read_sql_query(sql=query, con=connection, params=[value])
+    logger.debug('%s\n%s',query,df)
+    return df['id'][0]
+
+def insertYear(connection,season_id,season_name):
     query = """
     SELECT
         id
     FROM seasons
     WHERE id = ?;
     """
-    seasons_df = readQuery(db_name,query,[season_id])
+    seasons_df = readQuery(connection,query,[season_id])
 
     if seasons_df.empty:
+        # another league's process may have inserted the season since it was read
         query = """
         INSERT INTO seasons
         (id, season_name)
         VALUES
-        (?,?);
+        (?,?)
+        ON CONFLICT (id) DO NOTHING;
         """
-        insertQuery(db_name,query,[season_id,season_name])
+        with transaction(connection):
+            insertQuery(connection,query,[season_id,season_name])
 
-def insertTeams(db_name,season_id,season_name,league_id):
-    url = 'https://stats.nba.com/stats/commonteamyears'
+@timed('insertTeams')
+def insertTeams(connection,season_id,season_name,league_id):
+    url = f'{base_url}/commonteamyears'
     params = {
         'LeagueID':league_id,
     }
@@ -114,7 +461,7 @@ def insertTeams(db_name,season_id,season_name,league_id):
         id AS team_id
     FROM teams;
     """
-    teams_df = readQuery(db_name,query,[])
+    teams_df = readQuery(connection,query,[])
 
     query = """
     SELECT
@@ -124,58 +471,74 @@ def insertTeams(db_name,season_id,season_name,league_id):
         league_id = ?
         AND season_id = ?;
     """
-    league_season_teams_df = readQuery(db_name,query,[league_id,season_id])
+    league_season_teams_df = readQuery(connection,query,[league_id,season_id])
 
     df = df.merge(teams_df, on='team_id', how='left', indicator=True).rename(columns={'_merge':'teams'})
     df = df.merge(league_season_teams_df, on='team_id', how='left', indicator=True).rename(columns={'_merge':'league_season_teams'})
 
-    for index,row in df.iterrows():
-        team_id = row['team_id']
-        teams = row['teams']
-        league_season_teams = row['league_season_teams']
-
-        if teams == 'left_only':
-            #insert to teams
-            query = """
-            INSERT INTO teams
-            (id)
-            VALUES
-            (?);
-            """
-            insertQuery(db_name,query,[team_id])
-
-        if league_season_teams == 'left_only':
-            #get team info and insert to league_season_teams
-            url = 'https://stats.nba.com/stats/teaminfocommon'
-            params = {
-                'TeamID':str(team_id),
-                'LeagueID':league_id,
-                'Season': season_name,
-            }
-            team_info_df = getData(url,params)
+    # get team info for the teams missing from league_season_teams
+    new_team_ids = df[df['league_season_teams'] == 'left_only']['team_id'].to_list()
+    url = f'{base_url}/teaminfocommon'
+    url_params = [(url,{'TeamID':str(team_id),'LeagueID':league_id,'Season':season_name}) for team_id in new_team_ids]
+    league_season_teams_rows = []
+    for team_id, team_info_df in zip(new_team_ids,getManyData(url_params)):
+        league_season_teams_rows.append([league_id,season_id,team_id,team_info_df['team_city'][0],team_info_df['team_name'][0],team_info_df['team_abbreviation'][0],team_info_df['team_conference'][0],team_info_df['team_division'][0],team_info_df['team_code'][0]])
+
+    with transaction(connection):
+        #insert to teams
+        query = """
+        INSERT INTO teams
+        (id)
+        VALUES
+        (?)
+        ON CONFLICT (id) DO NOTHING;
+        """
+        insertManyQuery(connection,query,[[team_id] for team_id in df[df['teams'] == 'left_only']['team_id']])
+
+        query = """
+        INSERT INTO league_season_teams
+        (league_id,season_id,team_id,team_city,team_name,team_abbreviation,team_conference,team_division,team_code)
+        VALUES
+        (?,?,?,?,?,?,?,?,?);
+        """
+        insertManyQuery(connection,query,league_season_teams_rows)
+
+def getSeasonRanges(start,end,league_name):
+    # splits the dates from start to end into [season_name,season_start,season_end] for each season
+    season_ranges = []
+    ds = start
+    while ds <= end:
+        season_name = getSeason(ds,league_name)
+        if season_ranges and season_ranges[-1][0] == season_name:
+            season_ranges[-1][2] = ds
+        else:
+            season_ranges.append([season_name,ds,ds])
+        ds += timedelta(1)
+    return season_ranges
 
-            query = """
-            INSERT INTO league_season_teams
-            (league_id,season_id,team_id,team_city,team_name,team_abbreviation,team_conference,team_division,team_code)
-            VALUES
-            (?,?,?,?,?,?,?,?,?);
-            """
-            insertQuery(db_name,query,[league_id,season_id,team_id,team_info_df['team_city'][0],team_info_df['team_name'][0],team_info_df['team_abbreviation'][0],team_info_df['team_conference'][0],team_info_df['team_division'][0],team_info_df['team_code'][0]])
+def getDateChunks(start,end,days):
+    # splits the dates from start to end into [chunk_start,chunk_end] of at most days days, one chunk when days isn't set
+    if not days:
+        return [[start,end]]
+    return [[chunk_start,min(chunk_start + timedelta(days - 1),end)] for chunk_start in (start + timedelta(day) for day in range(0,(end - start).days + 1,days))]
 
-def insertGames(db_name,ds,season_id,season_name,league_id):
+def getSeasonTypes(connection):
     query = """
     SELECT
+        id AS season_type_id,
         season_type_name
-    FROM season_types;
+    FROM season_types
+    ORDER BY id;
     """
-    season_type_names = readQuery(db_name,query,[])['season_type_name'].to_list()
-    print(season_type_names)
-
-    for season_type_name in season_type_names:
-        season_type_id = int(getID(db_name,'season_types','season_type_name',season_type_name))
-        print(season_type_id)
+    return list(readQuery(connection,query,[]).itertuples(index=False,name=None))
 
-        url = 'https://stats.nba.com/stats/leaguegamelog'
+@timed('getGameLogs')
+def getGameLogs(start,end,season_name,league_id,season_types):
+    # one leaguegamelog call per season type covers every date from start to end
+    # dates without games never show up, so they are skipped without any more api calls
+    game_logs = {}
+    for season_type_id, season_type_name in season_types:
+        url = f'{base_url}/leaguegamelog'
         params = {
             'Counter':0,
             'Direction':'ASC',
@@ -184,202 +547,693 @@ def insertGames(db_name,ds,season_id,season_name,league_id):
             'Season':season_name,
             'SeasonType':season_type_name,
             'Sorter':'DATE',
-            'DateFrom':ds,
-            'DateTo':ds,
+            'DateFrom':start,
+            'DateTo':end,
         }
         df = getData(url,params)
 
-        if not df.empty:
-            # delete from all games tables
-            query = """
-            DELETE
-            FROM game_shot_charts
-            WHERE
-                game_id IN (
-                    SELECT
-                        id
-                    FROM games
-                    WHERE
-                        games.game_date = ?
-                        AND games.league_id = ?
-                        AND games.season_id = ?
-                        AND games.season_type_id = ?
-                );
-            """
-            insertQuery(db_name,query,[ds,league_id,season_id,season_type_id])
-
-            query = """
-            DELETE
-            FROM game_events
-            WHERE
-                game_id IN (
-                    SELECT
-                        id
-                    FROM games
-                    WHERE
-                        games.game_date = ?
-                        AND games.league_id = ?
-                        AND games.season_id = ?
-                        AND games.season_type_id = ?
-                );
-            """
-            insertQuery(db_name,query,[ds,league_id,season_id,season_type_id])
-
-            query = """
-            DELETE
-            FROM game_team_stats
-            WHERE
-                game_id IN (
-                    SELECT
-                        id
-                    FROM games
-                    WHERE
-                        games.game_date = ?
-                        AND games.league_id = ?
-                        AND games.season_id = ?
-                        AND games.season_type_id = ?
-                );
-            """
-            insertQuery(db_name,query,[ds,league_id,season_id,season_type_id])
-
-            query = """
-            DELETE
-            FROM games
-            WHERE
-                games.game_date = ?
-                AND games.league_id = ?
-                AND games.season_id = ?
-                AND games.season_type_id = ?;
-            """
-            insertQuery(db_name,query,[ds,league_id,season_id,season_type_id])
-
-            for index, row in df.iterrows():
-                game_id = row['game_id']
-                home_away = 'home'
-                if '@' in row['matchup']:
-                    home_away = 'away'
-                    query = """
-                    INSERT INTO games
-                    (id,league_id,season_id,season_type_id,game_date)
-                    VALUES
-                    (?,?,?,?,?);
-                    """
-                    insertQuery(db_name,query,[game_id,league_id,season_id,season_type_id,ds])
-
-                    # insert into game_team_stats
-                    query = """
-                    INSERT INTO game_team_stats
-                    (game_id,team_id,home_away,win_loss,fgm,fga,fg_pct,fg3m,fg3a,fg3_pct,ftm,fta,ft_pct,oreb,dreb,reb,ast,stl,blk,tov,pf,pts,plus_minus)
-                    VALUES
-                    (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);
-                    """
-                    insertQuery(db_name,query,[game_id,row['team_id'],home_away,row['wl'],row['fgm'],row['fga'],row['fg_pct'],row['fg3m'],row['fg3a'],row['fg3_pct'],row['ftm'],row['fta'],row['ft_pct'],row['oreb'],row['dreb'],row['reb'],row['ast'],row['stl'],row['blk'],row['tov'],row['pf'],row['pts'],row['plus_minus']])
-
-                    # call playbyplay
-                    url = 'https://stats.nba.com/stats/playbyplayv2'
-                    params = {
-                        'GameID':game_id,
-                        'StartPeriod':'0',
-                        'EndPeriod':'0',
-                    }
-                    pbp_df = getData(url,params)
-
-                    # check for players and insert...
-                    query = """
-                    SELECT
-                        id AS player_id
-                    FROM players;
-                    """
-                    players_df = readQuery(db_name,query,[])
-
-                    pbp_players_df = pd.concat(
-                        [
-                            pbp_df[pbp_df['person1type'].isin([4,5])][['player1_id']].rename(columns={'player1_id':'player_id'}),
-                            pbp_df[pbp_df['person2type'].isin([4,5])][['player2_id']].rename(columns={'player2_id':'player_id'}),
-                            pbp_df[pbp_df['person3type'].isin([4,5])][['player3_id']].rename(columns={'player3_id':'player_id'}),
-                        ],
-                        ignore_index=True
-                    ).drop_duplicates()
-
-                    pbp_players_df = pbp_players_df.merge(players_df, on='player_id', how='left', indicator=True).rename(columns={'_merge':'players'})
-                    pbp_players_df = pbp_players_df[pbp_players_df['players'] == 'left_only']
-
-                    for index, row in pbp_players_df.iterrows():
-                        player_id = row['player_id']
-
-                        url = 'https://stats.nba.com/stats/commonplayerinfo'
-                        params = {
-                            'LeagueID':league_id,'PlayerID':player_id
-                        }
-                        player_df = getData(url,params)
-
-                        query = """
-                        INSERT INTO players
-                        (id,first_name,last_name,birthdate,school,country,draft_year,draft_round,draft_number)
-                        VALUES
-                        (?,?,?,?,?,?,?,?,?);
-                        """
-                        insertQuery(db_name,query,[player_id,player_df['first_name'][0],player_df['last_name'][0],player_df['birthdate'][0],player_df['school'][0],player_df['country'][0],player_df['draft_year'][0],player_df['draft_round'][0],player_df['draft_number'][0]])
-
-                    # insert into game_events
-                    for index, row in pbp_df.iterrows():
-                        query = """
-                        INSERT INTO game_events
-                        (game_id,event_number,event_message_type,event_message_action_type,period,play_clock,home_description,neutral_description,visitor_description,score,score_margin,person_1_type,person_1_id,person_1_team_id,person_2_type,person_2_id,person_2_team_id,person_3_type,person_3_id,person_3_team_id)
-                        VALUES
-                        (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);
-                        """
-                        insertQuery(db_name,query,[game_id,row['eventnum'],row['eventmsgtype'],row['eventmsgactiontype'],row['period'],row['pctimestring'],row['homedescription'],row['neutraldescription'],row['visitordescription'],row['score'],row['scoremargin'],row['person1type'],row['player1_id'],row['player1_team_id'],row['person2type'],row['player2_id'],row['player2_team_id'],row['person3type'],row['player3_id'],row['player3_team_id'],])
-
-                else:
-                    # insert into game_team_stats
-                    query = """
-                    INSERT INTO game_team_stats
-                    (game_id,team_id,home_away,win_loss,fgm,fga,fg_pct,fg3m,fg3a,fg3_pct,ftm,fta,ft_pct,oreb,dreb,reb,ast,stl,blk,tov,pf,pts,plus_minus)
-                    VALUES
-                    (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);
-                    """
-                    insertQuery(db_name,query,[game_id,row['team_id'],home_away,row['wl'],row['fgm'],row['fga'],row['fg_pct'],row['fg3m'],row['fg3a'],row['fg3_pct'],row['ftm'],row['fta'],row['ft_pct'],row['oreb'],row['dreb'],row['reb'],row['ast'],row['stl'],row['blk'],row['tov'],row['pf'],row['pts'],row['plus_minus']])
-
-            # call shotchart
-            url = 'https://stats.nba.com/stats/shotchartdetail'
-            params = {
-                'ContextMeasure': 'FGA',
-                'LastNGames': 0,
-                'LeagueID': league_id,
-                'Month': 0,
-                'OpponentTeamID': 0,
-                'Period': 0,
-                'PlayerID': 0,
-                'SeasonType': season_type_name,
-                'TeamID': 0,
-                'VsDivision': '',
-                'VsConference': '',
-                'SeasonSegment': '',
-                'RookieYear': '',
-                'PlayerPosition': '',
-                'Outcome': '',
-                'Location': '',
-                'GameSegment': '',
-                'GameID': '',
-                'DateFrom': ds,
-                'DateTo': ds
-            }
-            sc_df = getData(url,params)
-
-            # insert into game_shot_charts
-            for index, row in sc_df.iterrows():
-                query = """
-                INSERT INTO game_shot_charts
-                (game_id,game_events_event_number,player_id,team_id,period,minutes_remaining,seconds_remaining,event_type,action_type,shot_type,shot_zone_basic,shot_zone_area,shot_zone_range,shot_distance,loc_x,loc_y,shot_attempted_flag,shot_made_flag)
-                VALUES
-                (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);
-                """
-                insertQuery(db_name,query,[row['game_id'],row['game_event_id'],row['player_id'],row['team_id'],row['period'],row['minutes_remaining'],row['seconds_remaining'],row['event_type'],row['action_type'],row['shot_type'],row['shot_zone_basic'],row['shot_zone_area'],row['shot_zone_range'],row['shot_distance'],row['loc_x'],row['loc_y'],row['shot_attempted_flag'],row['shot_made_flag'],])
-
-            # exit loop because found the season type that had games
+        for game_date, game_date_df in df.groupby('game_date'):
+            ds = date.fromisoformat(game_date[0:10])
+            # a date only gets the first season type that had games on it
+            if ds not in game_logs:
+                game_logs[ds] = (season_type_id,season_type_name,game_date_df.reset_index(drop=True))
+
+        # a single date doesn't need to check the rest of the season types
+        if start == end and game_logs:
             break
+    return game_logs
+
+def updateShotZones(connection,ds,league_id,season_id,season_type_id,game_ids,sign):
+    # adds (sign 1) or subtracts (sign -1) the shots of the given games on a date to the shot zone tables
+    for table, key in [('player_shot_zones','player_id'),('team_shot_zones','team_id')]:
+        query = f"""
+        INSERT INTO {table}
+        ({key},league_id,season_id,season_type_id,shot_zone_basic,shot_zone_area,shot_zone_range,attempts,makes)
+        SELECT
+            game_shot_charts.{key},
+            games.league_id,
+            games.season_id,
+            games.season_type_id,
+            game_shot_charts.shot_zone_basic,
+            game_shot_charts.shot_zone_area,
+            game_shot_charts.shot_zone_range,
+            ? * SUM(game_shot_charts.shot_attempted_flag) AS attempts,
+            ? * SUM(game_shot_charts.shot_made_flag) AS makes
+        FROM game_shot_charts
+        INNER JOIN games
+            ON game_shot_charts.game_id = games.id
+        WHERE
+            games.game_date = ?
+            AND games.league_id = ?
+            AND games.season_id = ?
+            AND games.season_type_id = ?
+            AND games.id IN (SELECT value FROM json_each(?))
+        GROUP BY
+            game_shot_charts.{key},
+            games.league_id,
+            games.season_id,
+            games.season_type_id,
+            game_shot_charts.shot_zone_basic,
+            game_shot_charts.shot_zone_area,
+            game_shot_charts.shot_zone_range
+        ON CONFLICT ({key},league_id,season_id,season_type_id,shot_zone_basic,shot_zone_area,shot_zone_range) DO UPDATE SET
+            attempts = {table}.attempts + excluded.attempts,
+            makes = {table}.makes + excluded.makes;
+        """
+        insertQuery(connection,query,[sign,sign,ds,league_id,season_id,season_type_id,json.dumps(game_ids)])
+
+        # only the zones of the players or teams in these games can have dropped to 0, so this is an index lookup instead of a scan
+        query = f"""
+        DELETE
+        FROM {table}
+        WHERE
+            {key} IN (
+                SELECT
+                    {key}
+                FROM game_shot_charts
+                WHERE
+                    game_id IN (SELECT value FROM json_each(?))
+            )
+            AND league_id = ?
+            AND season_id = ?
+            AND season_type_id = ?
+            AND attempts = 0;
+        """
+        insertQuery(connection,query,[json.dumps(game_ids),league_id,season_id,season_type_id])
+
+# player ids in the players table, loaded once per run and added to as players are inserted
+player_ids = None
+
+def getPlayerIDs(connection):
+    global player_ids
+    if player_ids is None:
+        query = """
+        SELECT
+            id AS player_id
+        FROM players;
+        """
+        player_ids = set(readQuery(connection,query,[])['player_id'].to_list())
+    return player_ids
+
+def getHash(rows):
+    # hash of api rows, json with default=str so dates and numpy values hash the same every run
+    return hashlib.sha256(json.dumps(rows,default=str).encode()).hexdigest()
+
+def getGameHashes(connection,game_ids):
+    query = """
+    SELECT
+        game_id,
+        game_log_hash,
+        play_by_play_hash,
+        shot_chart_hash
+    FROM game_hashes
+    WHERE
+        game_id IN (SELECT value FROM json_each(?));
+    """
+    return {game_id:(game_log_hash,play_by_play_hash,shot_chart_hash) for game_id, game_log_hash, play_by_play_hash, shot_chart_hash in readQuery(connection,query,[json.dumps(game_ids)]).itertuples(index=False,name=None)}
+
+def getStaleGameIDs(connection,ds,league_id,season_id,season_type_id,game_ids):
+    # games in the tables for the date that are no longer in the game log
+    query = """
+    SELECT
+        id AS game_id
+    FROM games
+    WHERE
+        games.game_date = ?
+        AND games.league_id = ?
+        AND games.season_id = ?
+        AND games.season_type_id = ?
+        AND games.id NOT IN (SELECT value FROM json_each(?));
+    """
+    return readQuery(connection,query,[ds,league_id,season_id,season_type_id,json.dumps(game_ids)])['game_id'].to_list()
 
+def getShotEventIDs(connection,game_ids):
+    # the game_events id of every made or missed shot of the games by (game_id, event_number), read after the events are written
+    query = """
+    SELECT
+        game_id,
+        event_number,
+        id
+    FROM game_events
+    WHERE
+        game_id IN (SELECT value FROM json_each(?))
+        AND event_message_type IN (1,2);
+    """
+    return {(game_id,event_number):event_id for game_id, event_number, event_id in readQuery(connection,query,[json.dumps(game_ids)]).itertuples(index=False,name=None)}
+
+def getClockSeconds(play_clock):
+    # '11:48' to 708 seconds left in the period
+    if play_clock is None:
+        return None
+    minutes, seconds = play_clock.split(':')
+    return int(minutes) * 60 + int(float(seconds))
+
+def getScores(score):
+    # the api score is 'away - home' and only set on scoring events, returns (home_score, away_score)
+    if score is None:
+        return None, None
+    away_score, home_score = score.split(' - ')
+    return int(home_score), int(away_score)
+
+def insertEventTypes(connection,game_event_rows,sc_headers,sc_rows):
+    # adds the event and action types of the game_events rows to their lookup tables, the shot action types get their name from the shot chart
+    action_type_names = {}
+    for event_rows in game_event_rows:
+        for game_id, event_number, event_type, action_type, *_ in event_rows:
+            action_type_names[(game_id,event_number)] = (event_type,action_type,None)
+    for game_id, event_number, action_type_name in selectColumns(sc_headers,sc_rows,['game_id','game_event_id','action_type']):
+        if (game_id,event_number) in action_type_names:
+            event_type, action_type, _ = action_type_names[(game_id,event_number)]
+            action_type_names[(game_id,event_number)] = (event_type,action_type,action_type_name)
+    # one row per action type, a name wins over no name
+    action_types = {}
+    for event_type, action_type, action_type_name in action_type_names.values():
+        if action_types.get((event_type,action_type)) is None:
+            action_types[(event_type,action_type)] = action_type_name
+
+    query = """
+    INSERT INTO event_message_types
+    (id)
+    VALUES
+    (?)
+    ON CONFLICT (id) DO NOTHING;
+    """
+    insertManyQuery(connection,query,[[event_type] for event_type in sorted({event_type for event_type, _ in action_types})])
+
+    query = """
+    INSERT INTO event_message_action_types
+    (event_message_type,event_message_action_type,action_type_name)
+    VALUES
+    (?,?,?)
+    ON CONFLICT (event_message_type,event_message_action_type) DO UPDATE SET
+        action_type_name = excluded.action_type_name
+    WHERE
+        excluded.action_type_name IS NOT NULL
+        AND event_message_action_types.action_type_name IS NOT excluded.action_type_name;
+    """
+    insertManyQuery(connection,query,[[event_type,action_type,action_type_name] for (event_type, action_type), action_type_name in sorted(action_types.items())])
+
+def getDescriptionID(description):
+    # the id of a description is the first 63 bits of its hash, so the same text gets the same id in every run and database
+    # and event_descriptions doesn't need a second copy of every description in a unique index to look them up
+    return int.from_bytes(hashlib.sha256(description.encode()).digest()[0:8],'big') >> 1
+
+def insertDescriptions(connection,descriptions):
+    # adds the {id: description} from getEventRows to event_descriptions
+    query = """
+    INSERT INTO event_descriptions
+    (id,description)
+    VALUES
+    (?,?)
+    ON CONFLICT (id) DO NOTHING;
+    """
+    insertManyQuery(connection,query,[[description_id,description] for description_id, description in descriptions.items()])
+
+def getEventRows(pbp_headers,pbp_rows,descriptions):
+    # turns playbyplayv2 rows into game_events rows with the clock in seconds, the score split and the descriptions as ids
+    # the ids only depend on the text, so they are made here and the text of each is added to descriptions for insertDescriptions
+    description_ids = {None:None}
+    for description_columns in selectColumns(pbp_headers,pbp_rows,['homedescription','neutraldescription','visitordescription']):
+        for description in description_columns:
+            if description not in description_ids:
+                description_ids[description] = getDescriptionID(description)
+                descriptions[description_ids[description]] = description
+
+    event_rows = []
+    for game_id, event_number, event_type, action_type, period, play_clock, home_description, neutral_description, visitor_description, score, *persons in selectColumns(pbp_headers,pbp_rows,['game_id','eventnum','eventmsgtype','eventmsgactiontype','period','pctimestring','homedescription','neutraldescription','visitordescription','score','person1type','player1_id','player1_team_id','person2type','player2_id','player2_team_id','person3type','player3_id','player3_team_id']):
+        event_rows.append((
+            game_id,event_number,event_type,action_type,period,getClockSeconds(play_clock),
+            description_ids[home_description],description_ids[neutral_description],description_ids[visitor_description],
+            *getScores(score),*persons,
+        ))
+    return event_rows
+
+# events whose players have to be on the floor, timeouts, ejections, replays and period starts and ends can name players on the bench
+lineup_event_types = {1,2,3,4,5,6,7,10}
+# foul action types of technicals, which can be called on players on the bench
+technical_foul_types = {11,12,13,16,18,19,25,30}
+
+def getEventPlayers(event_row):
+    # the (team_id, player_id) of the players in a game_events row that are on the floor
+    event_type, action_type = event_row[2], event_row[3]
+    if event_type not in lineup_event_types or (event_type == 6 and action_type in technical_foul_types):
+        return []
+    persons = event_row[11:20]
+    return [(team_id,player_id) for person_type, player_id, team_id in zip(persons[0::3],persons[1::3],persons[2::3]) if person_type in (4,5) and player_id is not None]
+
+def getSubstitution(event_row):
+    # (team_id, player_out, player_in) of a substitution, a person that isn't a player (type 4 or 5) with an id is None
+    # so rows with a 0 id or a missing player don't put phantom players on the floor
+    player_out = event_row[12] if event_row[11] in (4,5) and event_row[12] else None
+    player_in = event_row[15] if event_row[14] in (4,5) and event_row[15] else None
+    return event_row[13] or event_row[16], player_out, player_in
+
+def getPeriodStarters(period_events,last_lineups):
+    # the api doesn't say who starts a period, a starter is a player that is in an event or subbed out before being subbed in
+    # a team still missing a player (on the floor the whole period without being in an event) gets them from the end of the last period
+    starters = {}
+    subbed_in = {}
+    for event_row in period_events:
+        if event_row[2] == 8:
+            sub_team_id, player_out, player_in = getSubstitution(event_row)
+            players = [(sub_team_id,player_out)] if sub_team_id and player_out is not None else []
+        else:
+            players = getEventPlayers(event_row)
+        for team_id, player_id in players:
+            team_starters = starters.setdefault(team_id,[])
+            if player_id not in subbed_in.get(team_id,()) and player_id not in team_starters:
+                team_starters.append(player_id)
+        if event_row[2] == 8 and sub_team_id and player_in is not None:
+            subbed_in.setdefault(sub_team_id,set()).add(player_in)
+    for team_id, lineup in last_lineups.items():
+        team_starters = starters.setdefault(team_id,[])
+        for player_id in lineup:
+            if len(team_starters) < 5 and player_id not in team_starters and player_id not in subbed_in.get(team_id,()):
+                team_starters.append(player_id)
+    return starters
+
+def getLineupRow(period_events,team_id,start_index,players,end_index):
+    # the stint runs from the event at start_index to the one before end_index, its seconds until the clock of end_index (or the end of the period)
+    start_event = period_events[start_index]
+    end_clock = period_events[min(end_index,len(period_events) - 1)][5]
+    seconds = start_event[5] - end_clock if start_event[5] is not None and end_clock is not None else None
+    return (start_event[0],team_id,start_event[4],start_event[1],period_events[end_index - 1][1],seconds,*players,*[None] * (5 - len(players)))
+
+def getLineupRows(event_rows):
+    # walks a game's events once in event order and returns the game_lineups rows of both teams
+    # substitutions in a row are one lineup change, the new stint starts at the first of them
+    lineup_rows = []
+    last_lineups = {}
+    for period, period_events in groupby(sorted(event_rows,key=itemgetter(4,1)),key=itemgetter(4)):
+        period_events = list(period_events)
+        lineups = getPeriodStarters(period_events,last_lineups)
+        for team_id, lineup in lineups.items():
+            if len(lineup) > 5:
+                logger.warning('%s period %s team %s starts with %s players, only the first 5 found are kept',period_events[0][0],period,team_id,len(lineup))
+                del lineup[5:]
+        # team_id: [index of the first event of the stint, its players]
+        stints = {team_id:[0,sorted(lineup)] for team_id, lineup in lineups.items()}
+        # team_id: index of the first substitution of a change that hasn't been saved as a stint yet
+        changes = {}
+        for index, event_row in enumerate(period_events + [None]):
+            if event_row is not None and event_row[2] == 8:
+                team_id, player_out, player_in = getSubstitution(event_row)
+                if not team_id or player_in is None:
+                    logger.warning('%s event %s is a substitution without a player coming in, it is skipped',event_row[0],event_row[1])
+                    continue
+                changes.setdefault(team_id,index)
+                lineup = lineups.setdefault(team_id,[])
+                if player_out in lineup:
+                    lineup[lineup.index(player_out)] = player_in
+                elif len(lineup) < 5 and player_in not in lineup:
+                    lineup.append(player_in)
+                continue
+            for team_id, change_index in changes.items():
+                players = sorted(lineups[team_id])
+                if team_id not in stints:
+                    stints[team_id] = [change_index,players]
+                elif players != stints[team_id][1]:
+                    if change_index > stints[team_id][0]:
+                        lineup_rows.append(getLineupRow(period_events,team_id,*stints[team_id],change_index))
+                    stints[team_id] = [change_index,players]
+            changes = {}
+        for team_id, (start_index, players) in stints.items():
+            lineup_rows.append(getLineupRow(period_events,team_id,start_index,players,len(period_events)))
+        last_lineups = lineups
+    return lineup_rows
+
+# set from -reload, reloads every game even when its hashes match the last load
+reload_games = False
+# with -chunk_games the play by play of a date is fetched that many games at a time instead of all at once
+chunk_games = None
+
+@timed('insertGames')
+def insertGames(connection,ds,season_id,league_id,season_type_id,season_type_name,df):
+    # the away team row has an @ in the matchup, there is one per game
+    df['home_away'] = 'home'
+    df.loc[df['matchup'].str.contains('@'),'home_away'] = 'away'
+    game_ids = df[df['home_away'] == 'away']['game_id'].to_list()
+
+    # a game whose game log rows hash the same as the last load (which also saved its play by play and shots) is skipped
+    # without calling the api for it, a date where every game is skipped and no game was removed doesn't write anything
+    # -reload calls the api for every game, to pick up corrections that only changed the play by play or shots
+    game_log_hashes = {game_id:getHash(game_df.sort_values('team_id').drop(columns='home_away').values.tolist()) for game_id, game_df in df.groupby('game_id')}
+    stored_hashes = getGameHashes(connection,game_ids)
+    stale_game_ids = getStaleGameIDs(connection,ds,league_id,season_id,season_type_id,game_ids)
+    fetch_game_ids = [game_id for game_id in game_ids if reload_games or game_id not in stored_hashes or stored_hashes[game_id][0] != game_log_hashes[game_id]]
+    run_stats.add('games_unchanged',len(game_ids) - len(fetch_game_ids))
+    if not fetch_game_ids and not stale_game_ids:
+        logger.info('%s %s games unchanged',ds,len(game_ids))
+        return
+
+    # call the shotchart for the date and playbyplay for every game that may have changed in parallel
+    sc_url = f'{base_url}/shotchartdetail'
+    sc_params = {
+        'ContextMeasure': 'FGA',
+        'LastNGames': 0,
+        'LeagueID': league_id,
+        'Month': 0,
+        'OpponentTeamID': 0,
+        'Period': 0,
+        'PlayerID': 0,
+        'SeasonType': season_type_name,
+        'TeamID': 0,
+        'VsDivision': '',
+        'VsConference': '',
+        'SeasonSegment': '',
+        'RookieYear': '',
+        'PlayerPosition': '',
+        'Outcome': '',
+        'Location': '',
+        'GameSegment': '',
+        'GameID': '',
+        'DateFrom': ds,
+        'DateTo': ds
+    }
+    # a game that was loaded before is only fetched again because its game log changed, so its play by play and the date's shots
+    # skip the response cache, a response cached earlier in the ttl could be from before the correction
+    pbp_url = f'{base_url}/playbyplayv2'
+    url_params = [(sc_url,sc_params,any(game_id in stored_hashes for game_id in fetch_game_ids))] + [(pbp_url,{'GameID':game_id,'StartPeriod':'0','EndPeriod':'0'},game_id in stored_hashes) for game_id in fetch_game_ids]
+    # the big payloads stay as rows instead of dataframes, and come back -chunk_games at a time when it is set
+    results = getManyDataChunks(url_params,chunk_games,getRows)
+    sc_headers, sc_rows = next(results)
+    game_shot_rows = {game_id:[] for game_id in game_ids}
+    game_id_column = sc_headers.index('game_id')
+    for row in sc_rows:
+        if row[game_id_column] in game_shot_rows:
+            game_shot_rows[row[game_id_column]].append(row)
+
+    # only games where one of the hashes changed are written, and their events, lineups and shots only when the play by play
+    # or shots changed (a game log correction alone only rewrites games and game_team_stats)
+    # the play by play of each is made into game_events rows as soon as it comes back and the raw rows are dropped,
+    # so at most one chunk of raw play by play is in memory
+    new_hashes = {}
+    game_event_rows = {}
+    descriptions = {}
+    for game_id, (pbp_headers, pbp_rows) in zip(fetch_game_ids,results):
+        new_hashes[game_id] = (game_log_hashes[game_id],getHash(pbp_rows),getHash(game_shot_rows[game_id]))
+        if game_id not in stored_hashes or stored_hashes[game_id][1:] != new_hashes[game_id][1:]:
+            game_event_rows[game_id] = getEventRows(pbp_headers,pbp_rows,descriptions)
+    changed_game_ids = [game_id for game_id in fetch_game_ids if stored_hashes.get(game_id) != new_hashes[game_id]]
+    event_game_ids = [game_id for game_id in changed_game_ids if game_id in game_event_rows]
+    run_stats.add('games_unchanged',len(fetch_game_ids) - len(changed_game_ids))
+    run_stats.add('games_events_unchanged',len(changed_game_ids) - len(event_game_ids))
+    if not changed_game_ids and not stale_game_ids:
+        logger.info('%s %s games unchanged',ds,len(game_ids))
+        return
+    df = df[df['game_id'].isin(changed_game_ids)]
+    sc_rows = [row for game_id in event_game_ids for row in game_shot_rows[game_id]]
+
+    # check for players from every changed game on the date and get info for the new ones in one batch
+    pbp_player_ids = set()
+    for event_rows in game_event_rows.values():
+        for event_row in event_rows:
+            for person_type, player_id in [event_row[11:13],event_row[14:16],event_row[17:19]]:
+                if person_type in (4,5):
+                    pbp_player_ids.add(player_id)
+    new_player_ids = sorted(pbp_player_ids - getPlayerIDs(connection))
+
+    url = f'{base_url}/commonplayerinfo'
+    url_params = [(url,{'LeagueID':league_id,'PlayerID':player_id}) for player_id in new_player_ids]
+    players_rows = []
+    for player_id, player_df in zip(new_player_ids,getManyData(url_params)):
+        players_rows.append([player_id,player_df['first_name'][0],player_df['last_name'][0],player_df['birthdate'][0],player_df['school'][0],player_df['country'][0],player_df['draft_year'][0],player_df['draft_round'][0],player_df['draft_number'][0]])
+
+    # one transaction for the whole date, so a failed run leaves the previous load in place
+    with transaction(connection):
+        # take the current shots of the games being rewritten or removed out of the shot zone tables, they are added back after the reload
+        updateShotZones(connection,ds,league_id,season_id,season_type_id,event_game_ids + stale_game_ids,-1)
+
+        # delete games that are no longer on the date from all games tables
+        query = """
+        DELETE
+        FROM game_shot_charts
+        WHERE
+            game_id IN (
+                SELECT
+                    id
+                FROM games
+                WHERE
+                    games.game_date = ?
+                    AND games.league_id = ?
+                    AND games.season_id = ?
+                    AND games.season_type_id = ?
+                    AND games.id NOT IN (SELECT value FROM json_each(?))
+            );
+        """
+        insertQuery(connection,query,[ds,league_id,season_id,season_type_id,json.dumps(game_ids)])
+
+        query = """
+        DELETE
+        FROM game_events
+        WHERE
+            game_id IN (
+                SELECT
+                    id
+                FROM games
+                WHERE
+                    games.game_date = ?
+                    AND games.league_id = ?
+                    AND games.season_id = ?
+                    AND games.season_type_id = ?
+                    AND games.id NOT IN (SELECT value FROM json_each(?))
+            );
+        """
+        insertQuery(connection,query,[ds,league_id,season_id,season_type_id,json.dumps(game_ids)])
+
+        query = """
+        DELETE
+        FROM game_lineups
+        WHERE
+            game_id IN (
+                SELECT
+                    id
+                FROM games
+                WHERE
+                    games.game_date = ?
+                    AND games.league_id = ?
+                    AND games.season_id = ?
+                    AND games.season_type_id = ?
+                    AND games.id NOT IN (SELECT value FROM json_each(?))
+            );
+        """
+        insertQuery(connection,query,[ds,league_id,season_id,season_type_id,json.dumps(game_ids)])
+
+        query = """
+        DELETE
+        FROM game_team_stats
+        WHERE
+            game_id IN (
+                SELECT
+                    id
+                FROM games
+                WHERE
+                    games.game_date = ?
+                    AND games.league_id = ?
+                    AND games.season_id = ?
+                    AND games.season_type_id = ?
+                    AND games.id NOT IN (SELECT value FROM json_each(?))
+            );
+        """
+        insertQuery(connection,query,[ds,league_id,season_id,season_type_id,json.dumps(game_ids)])
+
+        query = """
+        DELETE
+        FROM games
+        WHERE
+            games.game_date = ?
+            AND games.league_id = ?
+            AND games.season_id = ?
+            AND games.season_type_id = ?
+            AND games.id NOT IN (SELECT value FROM json_each(?));
+        """
+        insertQuery(connection,query,[ds,league_id,season_id,season_type_id,json.dumps(game_ids)])
+
+        query = """
+        DELETE
+        FROM game_hashes
+        WHERE
+            game_id IN (SELECT value FROM json_each(?));
+        """
+        insertQuery(connection,query,[json.dumps(stale_game_ids)])
+
+        # the changed games are upserted, rows that didn't change are left alone
+        query = getUpsertQuery('games',['id','league_id','season_id','season_type_id','game_date'],['id'])
+        insertManyQuery(connection,query,[[game_id,league_id,season_id,season_type_id,ds] for game_id in changed_game_ids])
+
+        # insert into game_team_stats
+        query = getUpsertQuery('game_team_stats',['game_id','team_id','home_away','win_loss','fgm','fga','fg_pct','fg3m','fg3a','fg3_pct','ftm','fta','ft_pct','oreb','dreb','reb','ast','stl','blk','tov','pf','pts','plus_minus'],['game_id','team_id'])
+        insertManyQuery(connection,query,df[['game_id','team_id','home_away','wl','fgm','fga','fg_pct','fg3m','fg3a','fg3_pct','ftm','fta','ft_pct','oreb','dreb','reb','ast','stl','blk','tov','pf','pts','plus_minus']].itertuples(index=False,name=None))
+
+        query = """
+        DELETE
+        FROM game_team_stats
+        WHERE
+            game_id = ?
+            AND team_id NOT IN (SELECT value FROM json_each(?));
+        """
+        game_team_ids = df.groupby('game_id')['team_id'].agg(list).to_dict()
+        insertManyQuery(connection,query,[[game_id,json.dumps(game_team_ids.get(game_id,[]))] for game_id in changed_game_ids])
+
+        # players can move between leagues, so another league's process may have inserted them already
+        query = """
+        INSERT INTO players
+        (id,first_name,last_name,birthdate,school,country,draft_year,draft_round,draft_number)
+        VALUES
+        (?,?,?,?,?,?,?,?,?)
+        ON CONFLICT (id) DO NOTHING;
+        """
+        insertManyQuery(connection,query,players_rows)
+
+        # insert into game_events, with the lookup tables and descriptions it points at
+        insertEventTypes(connection,game_event_rows.values(),sc_headers,sc_rows)
+        insertDescriptions(connection,descriptions)
+        query = getUpsertQuery('game_events',['game_id','event_number','event_message_type','event_message_action_type','period','clock_seconds','home_description_id','neutral_description_id','visitor_description_id','home_score','away_score','person_1_type','person_1_id','person_1_team_id','person_2_type','person_2_id','person_2_team_id','person_3_type','person_3_id','person_3_team_id'],['game_id','event_number'])
+        for event_rows in game_event_rows.values():
+            insertManyQuery(connection,query,event_rows)
+
+        query = """
+        DELETE
+        FROM game_events
+        WHERE
+            game_id = ?
+            AND event_number NOT IN (SELECT value FROM json_each(?));
+        """
+        insertManyQuery(connection,query,[[game_id,json.dumps([event_row[1] for event_row in event_rows])] for game_id, event_rows in game_event_rows.items()])
+
+        # the lineups are rebuilt from the events of the changed games
+        with run_stats.timer('lineups'):
+            lineup_rows = [lineup_row for event_rows in game_event_rows.values() for lineup_row in getLineupRows(event_rows)]
+        query = """
+        DELETE
+        FROM game_lineups
+        WHERE
+            game_id IN (SELECT value FROM json_each(?));
+        """
+        insertQuery(connection,query,[json.dumps(event_game_ids)])
+
+        query = """
+        INSERT INTO game_lineups
+        (game_id,team_id,period,start_event_number,end_event_number,seconds,player_1_id,player_2_id,player_3_id,player_4_id,player_5_id)
+        VALUES
+        (?,?,?,?,?,?,?,?,?,?,?);
+        """
+        insertManyQuery(connection,query,lineup_rows)
+
+        # insert into game_shot_charts, each shot points at the id of its shot event in game_events
+        # a shot without a made or missed shot event of the same number in the play by play gets a NULL game_events_id
+        shot_event_ids = getShotEventIDs(connection,event_game_ids)
+        # the bins of every shot are worked out at once for the date
+        shot_cells = getShotCells(*zip(*selectColumns(sc_headers,sc_rows,['loc_x','loc_y']))) if sc_rows else []
+        shot_rows = [(game_id,game_event_id,shot_event_ids.get((game_id,game_event_id)),*shot,league_id,season_id,*cells) for (game_id, game_event_id, *shot), cells in zip(selectColumns(sc_headers,sc_rows,['game_id','game_event_id','player_id','team_id','period','minutes_remaining','seconds_remaining','event_type','action_type','shot_type','shot_zone_basic','shot_zone_area','shot_zone_range','shot_distance','loc_x','loc_y','shot_attempted_flag','shot_made_flag']),shot_cells)]
+        unmatched_shots = sum(1 for shot_row in shot_rows if shot_row[2] is None)
+        if unmatched_shots:
+            logger.warning('%s %s shots have no shot event in the play by play',ds,unmatched_shots)
+        run_stats.add('shots_unmatched',unmatched_shots)
+        query = getUpsertQuery('game_shot_charts',['game_id','game_events_event_number','game_events_id','player_id','team_id','period','minutes_remaining','seconds_remaining','event_type','action_type','shot_type','shot_zone_basic','shot_zone_area','shot_zone_range','shot_distance','loc_x','loc_y','shot_attempted_flag','shot_made_flag','league_id','season_id',*cell_columns],['game_id','game_events_event_number'])
+        insertManyQuery(connection,query,shot_rows)
+
+        query = """
+        DELETE
+        FROM game_shot_charts
+        WHERE
+            game_id = ?
+            AND game_events_event_number NOT IN (SELECT value FROM json_each(?));
+        """
+        game_event_numbers = {}
+        for game_id, game_event_id in selectColumns(sc_headers,sc_rows,['game_id','game_event_id']):
+            game_event_numbers.setdefault(game_id,[]).append(game_event_id)
+        insertManyQuery(connection,query,[[game_id,json.dumps(game_event_numbers.get(game_id,[]))] for game_id in event_game_ids])
+
+        updateShotZones(connection,ds,league_id,season_id,season_type_id,event_game_ids,1)
+
+        # saved in the same transaction as the games, so the hashes always match what is in the tables
+        query = getUpsertQuery('game_hashes',['game_id','game_log_hash','play_by_play_hash','shot_chart_hash','load_time'],['game_id'])
+        load_time = datetime.now().isoformat(timespec='seconds')
+        insertManyQuery(connection,query,[[game_id,*new_hashes[game_id],load_time] for game_id in changed_game_ids])
+
+    # only added after the commit, so a rolled back date doesn't hide players that were never inserted
+    player_ids.update(new_player_ids)
+    run_stats.add('games',len(changed_game_ids))
+
+
+def setGlobals(args):
+    # sets the api globals shared by every getData call from the arguments
+    global base_url, rate_limiter, max_workers, max_retries, session, response_cache, run_stats, reload_games, chunk_days, chunk_games
+    base_url = args.base_url.rstrip('/')
+    rate_limiter = RateLimiter(args.rps)
+    max_workers = args.workers
+    max_retries = args.retries
+    session = getSession(args.workers)
+    response_cache = ResponseCache(args.cache_dir,args.cache_ttl,args.cache_size,args.offline)
+    run_stats = RunStats()
+    reload_games = args.reload
+    chunk_days = args.chunk_days
+    chunk_games = args.chunk_games
+
+def insertRun(connection,start_time,league_id,start,end,status):
+    # saves the run_stats report of a league's run to the etl_runs table and returns the etl_runs id
+    report = run_stats.getReport()
+    query = """
+    INSERT INTO etl_runs
+    (start_time,end_time,league_id,start_date,end_date,status,seconds,api_calls,api_bytes,rows_written,report)
+    VALUES
+    (?,?,?,?,?,?,?,?,?,?,?);
+    """
+    with transaction(connection), closing(connection.cursor()) as cursor:
+        cursor.execute(query,[start_time,datetime.now().isoformat(timespec='seconds'),league_id,start.isoformat(),end.isoformat(),status,report['seconds'],run_stats.getTotal('api_calls.'),run_stats.getTotal('api_bytes.'),run_stats.getTotal('rows_written.'),json.dumps(report)])
+        etl_run_id = cursor.lastrowid
+    logger.info('etl_run %s %s in %ss, %s',etl_run_id,status,report['seconds'],report['stages'])
+    return etl_run_id
+
+# with -chunk_days a backfill calls leaguegamelog for that many days at a time instead of a whole season
+chunk_days = None
+
+def loadLeague(connection,league_name,league_id,start,end):
+    season_types = getSeasonTypes(connection)
+    logger.info('season_types %s',season_types)
+
+    # the season and teams are only loaded once per season in the date range, the game logs once per season or -chunk_days chunk of it
+    for season_name, season_start, season_end in getSeasonRanges(start,end,league_name):
+        season_id = int(season_name[0:4])
+        logger.info('%s to %s season %s',season_start,season_end,season_name)
+        # insert the season into the seasons table if not already there
+        insertYear(connection,season_id,season_name)
+
+        # WNBA season is only one year, so the season_name isn't YYYY-YY, just YYYY
+        if league_name == 'WNBA':
+            season_name = str(season_id)
+
+        # insert the teams into the teams and league_season_teams tables if not already there
+        insertTeams(connection,season_id,season_name,league_id)
+
+        # insert into games for each date that had games, each date's game log is dropped once it is loaded
+        for chunk_start, chunk_end in getDateChunks(season_start,season_end,chunk_days):
+            game_logs = getGameLogs(chunk_start,chunk_end,season_name,league_id,season_types)
+            for ds in sorted(game_logs):
+                season_type_id, season_type_name, df = game_logs.pop(ds)
+                insertGames(connection,ds,season_id,league_id,season_type_id,season_type_name,df)
+
+def runLeague(db_name,league_name,start,end,args):
+    # loads one league from start to end and returns its league_id
+    # when several leagues run at once this is the whole job of a worker process, so it sets up its own logging and globals
+    logging.basicConfig(level=args.log_level,format=f'%(asctime)s %(levelname)s {league_name} %(message)s',force=True)
+    setGlobals(args)
+    start_time = datetime.now().isoformat(timespec='seconds')
+
+    # one connection is used for the whole run
+    with closing(connect(db_name)) as connection:
+        league_id = getID(connection,'leagues','league_name',league_name)
+        logger.info('league_id %s',league_id)
+
+        # the run is saved to etl_runs even when it fails, with the stats up to the failure
+        status = 'failed'
+        try:
+            loadLeague(connection,league_name,league_id,start,end)
+            status = 'success'
+        finally:
+            insertRun(connection,start_time,league_id,start,end,status)
+    return league_id
 
 
 if __name__ == '__main__':
@@ -387,26 +1241,42 @@ if __name__ == '__main__':
     db_name = './assets/data/nba_stats.db'
 
     args = parseArguments()
+    logging.basicConfig(level=args.log_level,format='%(asctime)s %(levelname)s %(message)s')
+    setGlobals(args)
+
+    # a single -ds run is a backfill of one day
+    start = args.ds
+    end = args.ds
+    if args.start is not None:
+        start = args.start
+        end = args.end
 
-    # league_id for NBA
-    league_name = args.league
-    league_id = getID(db_name,'leagues','league_name',league_name)
-    print(league_id)
+    leagues = list(dict.fromkeys(args.league))
+    if len(leagues) == 1:
+        league_ids = [runLeague(db_name,leagues[0],start,end,args)]
+    else:
+        # each league loads in its own process, so the run takes as long as the slowest league instead of all of them added up
+        # the processes share the database through WAL and wait on each other's write transactions (see backend.connect)
+        # they all call the same api host, so each gets its share of -rps to keep the run under it
+        args.rps = args.rps / len(leagues)
+        with ProcessPoolExecutor(max_workers=len(leagues)) as executor:
+            league_ids = list(executor.map(runLeague,[db_name] * len(leagues),leagues,[start] * len(leagues),[end] * len(leagues),[args] * len(leagues)))
 
-    # get the ds from args used to run file and get the active season of the ds
-    ds = args.ds
-    season_name = getSeason(ds,league_name)
-    season_id = int(season_name[0:4])
-    print(ds,season_name,season_id)
-    # insert the season into the seasons table if not already there
-    insertYear(db_name,season_id,season_name)
+    # the steps after the load run one league at a time, a DuckDB file can only be opened by one process
+    for league_id in league_ids:
+        if args.export_dir is not None:
+            # only imported when exporting so the ETL still runs without pyarrow installed
+            from export import exportGames
+            with closing(connect(db_name)) as connection:
+                exportGames(connection,args.export_dir,league_id,start.isoformat(),end.isoformat())
 
-    # WNBA season is only one year, so the season_name isn't YYYY-YY, just YYYY
-    if league_name == 'WNBA':
-        season_name = str(season_id)
+        if args.duckdb is not None:
+            from backend import syncGames
+            with closing(connect(db_name)) as connection, closing(connect(args.duckdb)) as duckdb_connection:
+                syncGames(connection,duckdb_connection,league_id,start.isoformat(),end.isoformat())
 
-    # insert the teams into the teams and league_season_teams tables if not already there
-    insertTeams(db_name,season_id,season_name,league_id)
+        if args.data_quality:
+            runChecks(db_name,league_id,start.isoformat(),end.isoformat())
 
-    # insert into games
-    insertGames(db_name,ds,season_id,season_name,league_id)
+    # keep the api cache under its max size
+    response_cache.evict()
@@ -0,0 +1,100 @@
+import argparse
+import logging
+from contextlib import closing
+from datetime import date, timedelta
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as pa_dataset
+from backend import connect, readQuery
+
+# game_events and game_shot_charts are written as parquet files partitioned like
+# <export_dir>/<table>/league_id=00/season_id=2021/game_date=2021-11-10/part-0.parquet
+# so readers can skip whole leagues, seasons and dates and only read the columns they need
+partitioning = pa_dataset.partitioning(pa.schema([('league_id',pa.string()),('season_id',pa.int64()),('game_date',pa.string())]),flavor='hive')
+
+# game_events is exported with its text columns from the game_event_details view
+export_sources = {'game_events':'game_event_details'}
+
+logger = logging.getLogger('export')
+
+
+def parseArguments():
+    # argparse to get the league and dates to export
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-ds',help='date to export (YYYY-MM-DD)',type=date.fromisoformat,default=date.today() - timedelta(1))
+    parser.add_argument('-start',help='first date to export (YYYY-MM-DD), exports every date through -end instead of -ds',type=date.fromisoformat)
+    parser.add_argument('-end',help='last date to export (YYYY-MM-DD), defaults to the prior day',type=date.fromisoformat,default=date.today() - timedelta(1))
+    parser.add_argument('-league',help='league to export (NBA,WNBA,GLEAGUE)',choices=['NBA','WNBA','GLEAGUE'],default='NBA')
+    parser.add_argument('-export_dir',help='directory the parquet files are written to',default='./assets/data/export')
+    args = parser.parse_args()
+    return args
+
+def exportTable(connection,export_dir,table,league_id,game_date):
+    # rewrites the partition of one table for one league and date
+    source = export_sources.get(table,table)
+    query = f"""
+    SELECT
+        {source}.*,
+        games.league_id,
+        games.season_id,
+        games.game_date
+    FROM games
+    INNER JOIN {source}
+        ON games.id = {source}.game_id
+    WHERE
+        games.league_id = ?
+        AND games.game_date = ?;
+    """
+    df = readQuery(connection,query,[league_id,game_date])
+    # game_shot_charts has its own copy of league_id and season_id, the partition columns are only written once
+    df = df.loc[:,~df.columns.duplicated()]
+    if df.empty:
+        return 0
+    pa_dataset.write_dataset(
+        pa.Table.from_pandas(df,preserve_index=False),
+        f'{export_dir}/{table}',
+        format='parquet',
+        partitioning=partitioning,
+        existing_data_behavior='delete_matching',
+    )
+    return len(df)
+
+def exportGames(connection,export_dir,league_id,start,end):
+    # one date at a time so memory doesn't grow with the size of the date range
+    query = """
+    SELECT DISTINCT
+        game_date
+    FROM games
+    WHERE
+        league_id = ?
+        AND game_date BETWEEN ? AND ?
+    ORDER BY
+        game_date;
+    """
+    game_dates = readQuery(connection,query,[league_id,start,end])['game_date'].to_list()
+    for game_date in game_dates:
+        for table in ['game_events','game_shot_charts']:
+            row_count = exportTable(connection,export_dir,table,league_id,game_date)
+            logger.info('%s %s %s rows',table,game_date,row_count)
+
+def readExport(export_dir,table,columns=None,filters=None):
+    # filters are (column, op, value) tuples, filters on league_id, season_id and game_date skip whole partitions
+    return pd.read_parquet(f'{export_dir}/{table}',columns=columns,filters=filters,partitioning=partitioning)
+
+
+if __name__ == '__main__':
+    db_name = './assets/data/nba_stats.db'
+
+    args = parseArguments()
+    logging.basicConfig(level='INFO',format='%(asctime)s %(levelname)s %(message)s')
+
+    start = args.ds
+    end = args.ds
+    if args.start is not None:
+        start = args.start
+        end = args.end
+
+    # read only, it waits out an etl load's write transaction instead of failing with "database is locked"
+    with closing(connect(db_name,read_only=True)) as connection:
+        league_id = connection.execute('SELECT id FROM leagues WHERE league_name = ?;',[args.league]).fetchone()[0]
+        exportGames(connection,args.export_dir,league_id,start.isoformat(),end.isoformat())
@@ -0,0 +1,221 @@
+import os
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from threading import Lock
+import numpy as np
+from backend import connect, isDuckDB
+from shot_cells import cell_columns
+
+# the common reads of the database for dashboards and notebooks, returned as {column: numpy array}
+# a Queries object keeps one read only connection open for its whole life, sqlite3 keeps the prepared statement of every query text it runs
+# (the queries only change with which filters are passed) and the results are kept in an lru cache until the next etl run is saved to etl_runs
+# the etl_runs row is saved at the end of a run, so the dates a run is still loading can come back from before it until then
+# a DuckDB file can't be written while another process has it open, so on a .duckdb file a connection is only opened for a cache miss
+# or when the file changed since the last check of etl_runs, and the etl's -duckdb sync isn't locked out by a Queries that stays open
+#
+#   queries = Queries('./assets/data/nba_stats.db')
+#   shots = queries.getShots(player_id=1628378,season_id=2021)
+#   shots['loc_x'], shots['loc_y'], shots['shot_made_flag']
+
+
+def getArray(values):
+    # numbers with NULLs become floats with nan instead of an object array, text stays an object array
+    array = np.array(values)
+    if array.dtype == object and all(value is None or isinstance(value,(int,float)) for value in values):
+        array = np.array(values,dtype=float)
+    return array
+
+def getWhere(filters):
+    # the conditions of the filters that were passed, and their values
+    filters = {condition:value for condition, value in filters.items() if value is not None}
+    where = ' AND '.join(filters) if filters else '1 = 1'
+    return where, [str(value) if hasattr(value,'isoformat') else value for value in filters.values()]
+
+class Queries:
+    def __init__(self,db_name='./assets/data/nba_stats.db',cache_size=256):
+        self.db_name = db_name
+        self.connection = None if isDuckDB(db_name) else connect(db_name,read_only=True)
+        self.file_stats = None
+        self.duckdb_etl_run_id = None
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.etl_run_id = None
+        self.hits = 0
+        self.misses = 0
+        # the connection and cache are shared, threads take turns
+        self.lock = Lock()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    @contextmanager
+    def getConnection(self):
+        # the open SQLite connection, or a DuckDB one that is closed again right after
+        if self.connection is not None:
+            yield self.connection
+        else:
+            with closing(connect(self.db_name,read_only=True)) as connection:
+                yield connection
+
+    def getFileStats(self):
+        return [(os.stat(name).st_mtime_ns,os.stat(name).st_size) if os.path.exists(name) else None for name in [self.db_name,f'{self.db_name}.wal']]
+
+    def getETLRunID(self):
+        if self.connection is not None:
+            return self.connection.execute('SELECT MAX(id) FROM etl_runs;').fetchone()[0]
+        # the DuckDB file is only opened when it changed, a sync always writes it
+        file_stats = self.getFileStats()
+        if file_stats != self.file_stats:
+            with self.getConnection() as connection:
+                self.duckdb_etl_run_id = connection.execute('SELECT MAX(id) FROM etl_runs;').fetchone()[0]
+            self.file_stats = file_stats
+        return self.duckdb_etl_run_id
+
+    def query(self,query,values=()):
+        # returns {column: numpy array} of the query, from the cache when it already ran with the same values since the last etl run
+        # the cached arrays are read only since every caller gets the same ones
+        key = (query,tuple(values))
+        with self.lock:
+            etl_run_id = self.getETLRunID()
+            if etl_run_id != self.etl_run_id:
+                self.cache.clear()
+                self.etl_run_id = etl_run_id
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+            self.misses += 1
+            with self.getConnection() as connection:
+                cursor = connection.execute(query,list(values))
+                columns = [column[0] for column in cursor.description]
+                rows = cursor.fetchall()
+            arrays = {column:getArray(column_values) for column, column_values in zip(columns,zip(*rows) if rows else [()] * len(columns))}
+            for array in arrays.values():
+                array.flags.writeable = False
+            self.cache[key] = arrays
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return arrays
+
+    def getLeagueID(self,league_name):
+        return self.query('SELECT id FROM leagues WHERE league_name = ?;',[league_name])['id'][0]
+
+    def getShots(self,player_id=None,team_id=None,league_id=None,season_id=None,start=None,end=None):
+        # the shots matching the filters, the dates are game dates
+        where, values = getWhere({
+            'game_shot_charts.player_id = ?':player_id,
+            'game_shot_charts.team_id = ?':team_id,
+            'game_shot_charts.league_id = ?':league_id,
+            'game_shot_charts.season_id = ?':season_id,
+            'games.game_date >= ?':start,
+            'games.game_date <= ?':end,
+        })
+        query = f"""
+        SELECT
+            game_shot_charts.game_id,
+            games.game_date,
+            game_shot_charts.player_id,
+            game_shot_charts.team_id,
+            game_shot_charts.period,
+            game_shot_charts.minutes_remaining,
+            game_shot_charts.seconds_remaining,
+            game_shot_charts.action_type,
+            game_shot_charts.shot_type,
+            game_shot_charts.shot_zone_basic,
+            game_shot_charts.shot_distance,
+            game_shot_charts.loc_x,
+            game_shot_charts.loc_y,
+            game_shot_charts.shot_made_flag
+        FROM game_shot_charts
+        INNER JOIN games
+            ON game_shot_charts.game_id = games.id
+        WHERE
+            {where}
+        ORDER BY
+            games.game_date,
+            game_shot_charts.game_id,
+            game_shot_charts.game_events_event_number;
+        """
+        return self.query(query,values)
+
+    def getShotCells(self,cell_column,league_id,season_id,team_id=None,player_id=None):
+        # attempts and makes by cell (see shot_cells.py) for a heatmap, served from the index of the cell column
+        if cell_column not in cell_columns:
+            raise ValueError(f'cell_column must be one of {cell_columns}')
+        where, values = getWhere({
+            'league_id = ?':league_id,
+            'season_id = ?':season_id,
+            'team_id = ?':team_id,
+            'player_id = ?':player_id,
+        })
+        query = f"""
+        SELECT
+            {cell_column} AS cell,
+            COUNT(*) AS attempts,
+            SUM(shot_made_flag) AS makes
+        FROM game_shot_charts
+        WHERE
+            {cell_column} IS NOT NULL
+            AND {where}
+        GROUP BY
+            {cell_column}
+        ORDER BY
+            {cell_column};
+        """
+        return self.query(query,values)
+
+    def getGameEvents(self,game_id):
+        # the play by play of a game in event order with the text columns of the game_event_details view
+        query = """
+        SELECT
+            *
+        FROM game_event_details
+        WHERE
+            game_id = ?
+        ORDER BY
+            event_number;
+        """
+        return self.query(query,[game_id])
+
+    def getTeamGameLogs(self,team_id,season_id=None,season_type_id=None):
+        # the box score of every game of a team in date order
+        where, values = getWhere({
+            'game_team_stats.team_id = ?':team_id,
+            'games.season_id = ?':season_id,
+            'games.season_type_id = ?':season_type_id,
+        })
+        query = f"""
+        SELECT
+            games.id AS game_id,
+            games.game_date,
+            games.league_id,
+            games.season_id,
+            games.season_type_id,
+            game_team_stats.home_away,
+            game_team_stats.win_loss,
+            game_team_stats.pts,
+            game_team_stats.fgm,
+            game_team_stats.fga,
+            game_team_stats.fg3m,
+            game_team_stats.fg3a,
+            game_team_stats.ftm,
+            game_team_stats.fta,
+            game_team_stats.oreb,
+            game_team_stats.dreb,
+            game_team_stats.reb,
+            game_team_stats.ast,
+            game_team_stats.stl,
+            game_team_stats.blk,
+            game_team_stats.tov,
+            game_team_stats.pf,
+            game_team_stats.plus_minus
+        FROM game_team_stats
+        INNER JOIN games
+            ON game_team_stats.game_id = games.id
+        WHERE
+            {where}
+        ORDER BY
+            games.game_date;
+        """
+        return self.query(query,values)
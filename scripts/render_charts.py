@@ -0,0 +1,147 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from functools import lru_cache
+import numpy as np
+import matplotlib.pyplot as plt
+from queries import Queries
+from shot_chart import drawCourtOverlay, drawShots
+
+# draws a shot chart for every player and team of a league's season, to run after the nightly etl
+# the season's shots are read in one query and split by player and team, the charts are drawn on a pool of processes
+# that each set up one figure with the court overlay and only swap the bins and title for every chart they draw,
+# and a chart is only redrawn when its shots (or the chart options) changed since the last render
+# <output_dir>/<league>/<season>/players/<player_id>.png and <output_dir>/<league>/<season>/teams/<team_id>.png
+# manifest.json in output_dir has the hash of the shots of every chart from its last render
+
+logger = logging.getLogger('render_charts')
+
+
+def parseArguments():
+    # argparse to get the season and how to draw its charts
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-league',help='league to chart (NBA,WNBA,GLEAGUE)',choices=['NBA','WNBA','GLEAGUE'],default='NBA')
+    parser.add_argument('-season',help='season_id to chart (YYYY), defaults to the latest season of the league in the database',type=int)
+    parser.add_argument('-kind',help='hexbin or heatmap (square bins)',choices=['hexbin','heatmap'],default='hexbin')
+    parser.add_argument('-stat',help='color the bins by attempts or fg_pct',choices=['attempts','fg_pct'],default='fg_pct')
+    parser.add_argument('-bin_size',help='size of a bin in tenths of a foot',type=float,default=15.0)
+    parser.add_argument('-min_attempts',help='bins with fewer attempts are not drawn',type=int,default=1)
+    parser.add_argument('-workers',help='number of processes drawing charts',type=int,default=os.cpu_count())
+    parser.add_argument('-force',help='redraw every chart, even the ones whose shots didn\'t change',action='store_true')
+    parser.add_argument('-db',help='database to read the shots from, a .duckdb file reads the DuckDB copy',default='./assets/data/nba_stats.db')
+    parser.add_argument('-output_dir',help='directory the charts are saved to',default='./assets/images/shot_charts')
+    args = parser.parse_args()
+    return args
+
+def partitionShots(keys,*columns):
+    # splits the columns by key with one stable sort, so each key's shots keep their game order
+    order = np.argsort(keys,kind='stable')
+    unique_keys, starts = np.unique(keys[order],return_index=True)
+    parts = [np.split(column[order],starts[1:]) for column in columns]
+    return {int(key):tuple(part[index] for part in parts) for index, key in enumerate(unique_keys)}
+
+def getChartHash(loc_x,loc_y,made,options):
+    chart_hash = hashlib.sha256(json.dumps(options).encode())
+    for column in [loc_x,loc_y,made]:
+        chart_hash.update(np.ascontiguousarray(column,dtype=float).tobytes())
+    return chart_hash.hexdigest()
+
+def getCharts(queries,league_id,season_id):
+    # (path, title, loc_x, loc_y, made) of every player and team chart of the season
+    shots = queries.getShots(league_id=league_id,season_id=season_id)
+    player_names = {player_id:f'{first_name} {last_name}' for player_id, first_name, last_name in zip(*queries.query('SELECT id, first_name, last_name FROM players;').values())}
+    team_names = {team_id:f'{team_city} {team_name}' for team_id, team_city, team_name in zip(*queries.query('SELECT team_id, team_city, team_name FROM league_season_teams WHERE league_id = ? AND season_id = ?;',[league_id,season_id]).values())}
+
+    charts = []
+    for folder, keys, names in [('players',shots['player_id'],player_names),('teams',shots['team_id'],team_names)]:
+        for key, (loc_x, loc_y, made) in partitionShots(keys,shots['loc_x'],shots['loc_y'],shots['shot_made_flag']).items():
+            title = f'{names.get(key,key)} {season_id}, {len(loc_x)} shots, {np.mean(made):.1%} FG'
+            charts.append((os.path.join(folder,f'{key}.png'),title,loc_x,loc_y,made))
+    return charts
+
+class ChartCanvas:
+    # the figure, axes, court overlay and colorbar are made once, the same as shot_chart.plotShotChart makes them for every chart
+    def __init__(self,kind,stat,bin_size,min_attempts):
+        self.options = (kind,stat,bin_size,min_attempts)
+        self.fig, self.ax = plt.subplots(figsize=(6,5.64))
+        self.image = None
+        self.colorbar = None
+
+    def draw(self,loc_x,loc_y,made,title):
+        if self.image is not None:
+            self.image.remove()
+        self.image = drawShots(self.ax,loc_x,loc_y,made,*self.options)
+        if self.colorbar is None:
+            self.colorbar = self.fig.colorbar(self.image,ax=self.ax,label='FG%' if self.options[1] == 'fg_pct' else 'Attempts')
+            drawCourtOverlay(self.ax)
+        else:
+            self.colorbar.update_normal(self.image)
+        self.ax.set_title(title)
+        return self.fig
+
+@lru_cache(maxsize=None)
+def getCanvas(kind,stat,bin_size,min_attempts):
+    # one canvas per worker process for each set of chart options
+    return ChartCanvas(kind,stat,bin_size,min_attempts)
+
+def renderCharts(output_dir,charts,kind,stat,bin_size,min_attempts):
+    # draws a batch of charts in a worker process on its canvas
+    canvas = getCanvas(kind,stat,bin_size,min_attempts)
+    for path, title, loc_x, loc_y, made in charts:
+        os.makedirs(os.path.dirname(os.path.join(output_dir,path)),exist_ok=True)
+        canvas.draw(loc_x,loc_y,made,title).savefig(os.path.join(output_dir,path))
+    return len(charts)
+
+def readManifest(output_dir):
+    try:
+        with open(os.path.join(output_dir,'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def writeManifest(output_dir,manifest):
+    # written to a temp file first so a failed write doesn't lose the hashes of the earlier renders
+    manifest_name = os.path.join(output_dir,'manifest.json')
+    with open(manifest_name + '.tmp','w') as f:
+        json.dump(manifest,f,indent=4,sort_keys=True)
+    os.replace(manifest_name + '.tmp',manifest_name)
+
+def renderSeason(db_name,output_dir,league_name,season_id,kind,stat,bin_size,min_attempts,workers,force=False):
+    # draws the charts of the season whose shots changed since the last render and returns how many were drawn
+    with closing(Queries(db_name)) as queries:
+        league_id = queries.getLeagueID(league_name)
+        if season_id is None:
+            season_id = int(queries.query('SELECT MAX(season_id) AS season_id FROM games WHERE league_id = ?;',[league_id])['season_id'][0])
+        charts = getCharts(queries,league_id,season_id)
+
+    season_dir = os.path.join(league_name,str(season_id))
+    options = [kind,stat,bin_size,min_attempts]
+    manifest = readManifest(output_dir)
+    chart_hashes = {os.path.join(season_dir,path):getChartHash(loc_x,loc_y,made,options) for path, _, loc_x, loc_y, made in charts}
+    changed_charts = [chart for chart, (path, chart_hash) in zip(charts,chart_hashes.items()) if force or manifest.get(path) != chart_hash or not os.path.exists(os.path.join(output_dir,path))]
+    logger.info('%s %s: %s charts, %s changed',league_name,season_id,len(charts),len(changed_charts))
+    if not changed_charts:
+        return 0
+
+    # a few batches per worker so the processes finish about the same time, each batch is one pickle of its shots
+    batch_count = min(len(changed_charts),max(workers,1) * 4)
+    batches = [changed_charts[index::batch_count] for index in range(batch_count)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(renderCharts,os.path.join(output_dir,season_dir),batch,kind,stat,bin_size,min_attempts) for batch in batches]
+        rendered = sum(future.result() for future in futures)
+
+    manifest.update({path:chart_hash for path, chart_hash in chart_hashes.items()})
+    writeManifest(output_dir,manifest)
+    return rendered
+
+
+if __name__ == '__main__':
+    args = parseArguments()
+    logging.basicConfig(level='INFO',format='%(asctime)s %(levelname)s %(message)s')
+    os.makedirs(args.output_dir,exist_ok=True)
+    rendered = renderSeason(args.db,args.output_dir,args.league,args.season,args.kind,args.stat,args.bin_size,args.min_attempts,args.workers,args.force)
+    logger.info('%s charts drawn',rendered)
@@ -0,0 +1,156 @@
+import argparse
+import gzip
+import json
+import logging
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Lock
+from time import monotonic, sleep
+from urllib.parse import parse_qsl, urlsplit
+from etl import ResponseCache
+from synthetic import endpoints, getPayload
+
+# a local stand-in for stats.nba.com that answers the six endpoints etl.py calls
+# run etl.py with -base_url http://localhost:<port>/stats to exercise its network path (pool, retries, rate limiting)
+# against a configurable amount of latency, errors and throttling without calling the real api
+
+logger = logging.getLogger('server')
+
+# the recorded responses in the etl's api cache are stored under the real api's urls
+api_url = 'https://stats.nba.com/stats'
+
+
+def parseArguments():
+    # argparse to get how the stand-in api behaves
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-port',help='port to listen on',type=int,default=8000)
+    parser.add_argument('-latency',help='seconds every response is delayed',type=float,default=0.0)
+    parser.add_argument('-jitter',help='up to this many more seconds are added to the latency at random',type=float,default=0.0)
+    parser.add_argument('-error_rate',help='fraction of requests answered with a 500',type=float,default=0.0)
+    parser.add_argument('-throttle_rate',help='fraction of requests answered with a 429 at random',type=float,default=0.0)
+    parser.add_argument('-max_rps',help='requests per second over which every request gets a 429, like the real api throttling',type=float)
+    parser.add_argument('-retry_after',help='seconds sent in the Retry-After header of a 429, none if not set',type=int)
+    parser.add_argument('-payload_scale',help='the play by play and shot chart rows are repeated this many times to make bigger payloads',type=int,default=1)
+    parser.add_argument('-cache_dir',help='serve the recorded responses in this etl api cache directory when there is one, synthetic ones otherwise')
+    parser.add_argument('-seed',help='seed of the random errors and throttling',type=int,default=0)
+    args = parser.parse_args()
+    return args
+
+def scalePayload(payload,payload_scale):
+    # repeats the rows of the big result sets, the event numbers are shifted so the repeats are new events
+    for result_set in payload['resultSets']:
+        headers = result_set['headers']
+        rows = result_set['rowSet']
+        event_columns = [headers.index(column) for column in ['EVENTNUM','GAME_EVENT_ID'] if column in headers]
+        if not event_columns:
+            continue
+        scaled_rows = list(rows)
+        for repeat in range(1,payload_scale):
+            for row in rows:
+                row = list(row)
+                for event_column in event_columns:
+                    row[event_column] += repeat * 10000
+                scaled_rows.append(row)
+        result_set['rowSet'] = scaled_rows
+    return payload
+
+class StatsServer(ThreadingHTTPServer):
+    # holds the options and the counts of what was served, shared by the handler threads
+    daemon_threads = True
+
+    def __init__(self,address,args):
+        super().__init__(address,StatsHandler)
+        self.args = args
+        self.rng = Random(args.seed)
+        self.response_cache = ResponseCache(args.cache_dir,float('inf'),float('inf'),offline=True) if args.cache_dir is not None else None
+        self.request_times = deque()
+        self.counts = Counter()
+        self.lock = Lock()
+
+    def getStatus(self):
+        # picks the status of a request from the throttling and error options
+        with self.lock:
+            now = monotonic()
+            self.request_times.append(now)
+            while self.request_times[0] < now - 1:
+                self.request_times.popleft()
+            if self.args.max_rps is not None and len(self.request_times) > self.args.max_rps:
+                return 429
+            roll = self.rng.random()
+            if roll < self.args.throttle_rate:
+                return 429
+            if roll < self.args.throttle_rate + self.args.error_rate:
+                return 500
+            return 200
+
+    def getContent(self,endpoint,params):
+        if self.response_cache is not None:
+            try:
+                content = self.response_cache.get(f'{api_url}/{endpoint}',params)
+                self.count('recorded')
+                return content
+            except FileNotFoundError:
+                pass
+        payload = getPayload(endpoint,params)
+        if self.args.payload_scale > 1:
+            payload = scalePayload(payload,self.args.payload_scale)
+        return json.dumps(payload).encode()
+
+    def count(self,name):
+        with self.lock:
+            self.counts[name] += 1
+
+class StatsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.rstrip('/').rsplit('/',1)[-1]
+        params = dict(parse_qsl(url.query,keep_blank_values=True))
+        args = self.server.args
+
+        sleep(args.latency + self.server.rng.random() * args.jitter)
+        if endpoint not in endpoints:
+            self.sendResponse(404,b'')
+            return
+        status = self.server.getStatus()
+        self.server.count(f'{endpoint} {status}')
+        if status != 200:
+            headers = {'Retry-After':str(args.retry_after)} if status == 429 and args.retry_after is not None else {}
+            self.sendResponse(status,b'',headers)
+            return
+        self.sendResponse(200,self.server.getContent(endpoint,params))
+
+    def sendResponse(self,status,content,headers=None):
+        headers = dict(headers or {})
+        if content and 'gzip' in self.headers.get('Accept-Encoding',''):
+            content = gzip.compress(content,compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type','application/json; charset=utf-8')
+        self.send_header('Content-Length',str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name,value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self,format,*args):
+        logger.debug(format,*args)
+
+
+if __name__ == '__main__':
+    args = parseArguments()
+    logging.basicConfig(level='INFO',format='%(asctime)s %(levelname)s %(message)s')
+
+    server = StatsServer(('localhost',args.port),args)
+    logger.info('serving the stand-in api on http://localhost:%s/stats',args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # how many requests of each endpoint got each status, to compare runs with different etl settings
+        for name, count in sorted(server.counts.items()):
+            logger.info('%s %s',name,count)
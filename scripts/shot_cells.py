@@ -0,0 +1,83 @@
+import math
+import numpy as np
+
+# integer ids of the square and hexagon bins a shot falls in, saved by the etl on every shot
+# so spatial filters and heatmaps can use the indexes on the cell columns of game_shot_charts instead of scanning loc_x/loc_y
+# a grid cell is the flat index of the bin in the arrays of shot_chart.binShots and a hex cell is the index of the hexagon
+# in ax.hexbin(gridsize=getHexGridSize(bin_size),extent=COURT_EXTENT), so both line up with the charts shot_chart.py draws
+
+# loc_x and loc_y are in tenths of a foot with the hoop at (0,0)
+COURT_EXTENT = (-250,250,-47.5,422.5)
+
+# bin sizes in tenths of a foot, each is a <kind>_<size>_cell column of game_shot_charts
+grid_sizes = [10,30]
+hex_sizes = [15,30]
+cell_columns = [f'grid_{bin_size}_cell' for bin_size in grid_sizes] + [f'hex_{bin_size}_cell' for bin_size in hex_sizes]
+
+
+def getGridEdges(bin_size):
+    # edges of the square bins over the half court
+    x_edges = np.arange(COURT_EXTENT[0],COURT_EXTENT[1] + bin_size,bin_size)
+    y_edges = np.arange(COURT_EXTENT[2],COURT_EXTENT[3] + bin_size,bin_size)
+    return x_edges, y_edges
+
+def getGridCells(loc_x,loc_y,bin_size):
+    # bins the same way as np.histogram2d (the last edge is in the last bin), -1 for shots off the half court
+    x_edges, y_edges = getGridEdges(bin_size)
+    loc_x = np.asarray(loc_x,float)
+    loc_y = np.asarray(loc_y,float)
+    ix = np.searchsorted(x_edges,loc_x,side='right') - 1
+    iy = np.searchsorted(y_edges,loc_y,side='right') - 1
+    ix[loc_x == x_edges[-1]] = len(x_edges) - 2
+    iy[loc_y == y_edges[-1]] = len(y_edges) - 2
+    on_court = (ix >= 0) & (ix < len(x_edges) - 1) & (iy >= 0) & (iy < len(y_edges) - 1)
+    return np.where(on_court,ix * (len(y_edges) - 1) + iy,-1)
+
+def getGridCellIDs(bin_size,x_range,y_range):
+    # ids of the square bins that overlap a rectangle of the court, filter on them with the exact loc_x/loc_y condition
+    x_edges, y_edges = getGridEdges(bin_size)
+    columns = [ix for ix in range(len(x_edges) - 1) if x_edges[ix] <= x_range[1] and x_edges[ix + 1] >= x_range[0]]
+    rows = [iy for iy in range(len(y_edges) - 1) if y_edges[iy] <= y_range[1] and y_edges[iy + 1] >= y_range[0]]
+    return [ix * (len(y_edges) - 1) + iy for ix in columns for iy in rows]
+
+def getHexGridSize(bin_size):
+    # the gridsize shot_chart.plotShotChart passes to hexbin for a bin size
+    return int((COURT_EXTENT[1] - COURT_EXTENT[0]) / bin_size)
+
+def getHexGrid(bin_size):
+    # the two offset lattices of hexbin, its padding keeps the hexagons the same as the ones it draws
+    nx = getHexGridSize(bin_size)
+    ny = int(nx / math.sqrt(3))
+    xmin, xmax, ymin, ymax = COURT_EXTENT
+    padding = 1.e-9 * (xmax - xmin)
+    xmin -= padding
+    xmax += padding
+    return nx, ny, xmin, ymin, (xmax - xmin) / nx, (ymax - ymin) / ny
+
+def getHexCells(loc_x,loc_y,bin_size):
+    # picks the nearest center of the two lattices like hexbin, -1 for shots off the half court
+    nx, ny, xmin, ymin, sx, sy = getHexGrid(bin_size)
+    ix = (np.asarray(loc_x,float) - xmin) / sx
+    iy = (np.asarray(loc_y,float) - ymin) / sy
+    ix1 = np.round(ix).astype(int)
+    iy1 = np.round(iy).astype(int)
+    ix2 = np.floor(ix).astype(int)
+    iy2 = np.floor(iy).astype(int)
+    cells1 = np.where((ix1 >= 0) & (ix1 < nx + 1) & (iy1 >= 0) & (iy1 < ny + 1),ix1 * (ny + 1) + iy1,-1)
+    cells2 = np.where((ix2 >= 0) & (ix2 < nx) & (iy2 >= 0) & (iy2 < ny),(nx + 1) * (ny + 1) + ix2 * ny + iy2,-1)
+    on_first = (ix - ix1) ** 2 + 3.0 * (iy - iy1) ** 2 < (ix - ix2 - 0.5) ** 2 + 3.0 * (iy - iy2 - 0.5) ** 2
+    return np.where(on_first,cells1,cells2)
+
+def getHexCenters(bin_size):
+    # loc_x and loc_y of the center of every hex cell, indexed by the cell id
+    nx, ny, xmin, ymin, sx, sy = getHexGrid(bin_size)
+    ix1, iy1 = np.meshgrid(np.arange(nx + 1),np.arange(ny + 1),indexing='ij')
+    ix2, iy2 = np.meshgrid(np.arange(nx),np.arange(ny),indexing='ij')
+    center_x = np.concatenate([xmin + ix1.ravel() * sx,xmin + (ix2.ravel() + 0.5) * sx])
+    center_y = np.concatenate([ymin + iy1.ravel() * sy,ymin + (iy2.ravel() + 0.5) * sy])
+    return center_x, center_y
+
+def getShotCells(loc_x,loc_y):
+    # the values of cell_columns for each shot, None where a shot is off the half court
+    cells = np.stack([getGridCells(loc_x,loc_y,bin_size) for bin_size in grid_sizes] + [getHexCells(loc_x,loc_y,bin_size) for bin_size in hex_sizes],axis=1)
+    return [tuple(cell if cell >= 0 else None for cell in shot_cells) for shot_cells in cells.tolist()]
@@ -1,7 +1,133 @@
+import argparse
+from contextlib import closing
+from datetime import date
+from functools import lru_cache
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from matplotlib.patches import Arc, Circle, Rectangle
+import numpy as np
 import pandas as pd
+from queries import Queries
+from shot_cells import COURT_EXTENT, getGridEdges, getHexGridSize
 
-shot_df = pd.read_csv('./assets/data/shots.csv')
 
-plt.scatter(shot_df.LOC_X, shot_df.LOC_Y)
-plt.savefig('./assets/images/test_shot_chart.png')
+def parseArguments():
+    # argparse to get which shots to chart
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-player',help='player_id to chart',type=int)
+    parser.add_argument('-team',help='team_id to chart',type=int)
+    parser.add_argument('-league',help='league to chart (NBA,WNBA,GLEAGUE)',choices=['NBA','WNBA','GLEAGUE'])
+    parser.add_argument('-season',help='season_id to chart (YYYY)',type=int)
+    parser.add_argument('-start',help='first game date to chart (YYYY-MM-DD)',type=date.fromisoformat)
+    parser.add_argument('-end',help='last game date to chart (YYYY-MM-DD)',type=date.fromisoformat)
+    parser.add_argument('-kind',help='hexbin or heatmap (square bins)',choices=['hexbin','heatmap'],default='hexbin')
+    parser.add_argument('-stat',help='color the bins by attempts or fg_pct',choices=['attempts','fg_pct'],default='fg_pct')
+    parser.add_argument('-bin_size',help='size of a bin in tenths of a foot',type=float,default=15.0)
+    parser.add_argument('-min_attempts',help='bins with fewer attempts are not drawn',type=int,default=1)
+    parser.add_argument('-csv',help='read the shots from a shotchartdetail csv instead of the database')
+    parser.add_argument('-db',help='database to read the shots from, a .duckdb file reads the DuckDB copy',default='./assets/data/nba_stats.db')
+    parser.add_argument('-output',help='file the chart is saved to',default='./assets/images/shot_chart.png')
+    args = parser.parse_args()
+    return args
+
+def getCSVShots(csv_name):
+    shot_df = pd.read_csv(csv_name)
+    return shot_df['LOC_X'].to_numpy(float), shot_df['LOC_Y'].to_numpy(float), shot_df['SHOT_MADE_FLAG'].to_numpy(float)
+
+def binShots(loc_x,loc_y,made,bin_size):
+    # square bins over the half court, fg_pct is nan where there were no attempts
+    x_edges, y_edges = getGridEdges(bin_size)
+    attempts, _, _ = np.histogram2d(loc_x,loc_y,bins=[x_edges,y_edges])
+    makes, _, _ = np.histogram2d(loc_x,loc_y,bins=[x_edges,y_edges],weights=made)
+    fg_pct = np.divide(makes,attempts,out=np.full(attempts.shape,np.nan),where=attempts > 0)
+    return x_edges, y_edges, attempts, makes, fg_pct
+
+def drawCourt(ax,color='black',lw=1.5):
+    court_elements = [
+        # hoop and backboard
+        Circle((0,0),radius=7.5,linewidth=lw,color=color,fill=False),
+        Rectangle((-30,-7.5),60,-1,linewidth=lw,color=color),
+        # paint, outer and inner box
+        Rectangle((-80,-47.5),160,190,linewidth=lw,color=color,fill=False),
+        Rectangle((-60,-47.5),120,190,linewidth=lw,color=color,fill=False),
+        # free throw arcs
+        Arc((0,142.5),120,120,theta1=0,theta2=180,linewidth=lw,color=color,fill=False),
+        Arc((0,142.5),120,120,theta1=180,theta2=0,linewidth=lw,color=color,linestyle='dashed'),
+        # restricted area
+        Arc((0,0),80,80,theta1=0,theta2=180,linewidth=lw,color=color),
+        # corner threes and the three point arc
+        Rectangle((-220,-47.5),0,140,linewidth=lw,color=color),
+        Rectangle((220,-47.5),0,140,linewidth=lw,color=color),
+        Arc((0,0),475,475,theta1=22,theta2=158,linewidth=lw,color=color),
+        # center court
+        Arc((0,422.5),120,120,theta1=180,theta2=0,linewidth=lw,color=color),
+        Arc((0,422.5),40,40,theta1=180,theta2=0,linewidth=lw,color=color),
+        # outer lines
+        Rectangle((-250,-47.5),500,470,linewidth=lw,color=color,fill=False),
+    ]
+    for element in court_elements:
+        ax.add_patch(element)
+    return ax
+
+@lru_cache(maxsize=None)
+def getCourtImage(dpi=100):
+    # the court lines are drawn once to an rgba array and reused as an overlay for every chart
+    fig = plt.figure(figsize=(5,4.7),dpi=dpi)
+    fig.patch.set_alpha(0)
+    ax = fig.add_axes([0,0,1,1])
+    ax.set_xlim(COURT_EXTENT[0],COURT_EXTENT[1])
+    ax.set_ylim(COURT_EXTENT[2],COURT_EXTENT[3])
+    ax.axis('off')
+    drawCourt(ax)
+    fig.canvas.draw()
+    court_image = np.asarray(fig.canvas.buffer_rgba()).copy()
+    plt.close(fig)
+    return court_image
+
+def drawShots(ax,loc_x,loc_y,made,kind='hexbin',stat='fg_pct',bin_size=15.0,min_attempts=1):
+    # draws the bins of the shots on ax and returns them for the colorbar
+    if kind == 'hexbin':
+        gridsize = getHexGridSize(bin_size)
+        if stat == 'fg_pct':
+            return ax.hexbin(loc_x,loc_y,C=made,reduce_C_function=np.mean,gridsize=gridsize,extent=COURT_EXTENT,mincnt=min_attempts,cmap='RdYlGn',vmin=0,vmax=1)
+        return ax.hexbin(loc_x,loc_y,gridsize=gridsize,extent=COURT_EXTENT,mincnt=min_attempts,cmap='viridis',bins='log')
+    x_edges, y_edges, attempts, makes, fg_pct = binShots(loc_x,loc_y,made,bin_size)
+    values = fg_pct if stat == 'fg_pct' else attempts
+    values = np.ma.masked_where(attempts < max(min_attempts,1),values)
+    if stat == 'fg_pct':
+        return ax.pcolormesh(x_edges,y_edges,values.T,cmap='RdYlGn',vmin=0,vmax=1)
+    return ax.pcolormesh(x_edges,y_edges,values.T,cmap='viridis')
+
+def drawCourtOverlay(ax):
+    # the court lines go over the bins, the axes are fit to the half court
+    ax.imshow(getCourtImage(),extent=COURT_EXTENT,zorder=3)
+    ax.set_xlim(COURT_EXTENT[0],COURT_EXTENT[1])
+    ax.set_ylim(COURT_EXTENT[2],COURT_EXTENT[3])
+    ax.set_aspect('equal')
+    ax.axis('off')
+
+def getTitle(loc_x,made):
+    return f'{len(loc_x)} shots, {np.mean(made) if len(made) else 0:.1%} FG'
+
+def plotShotChart(loc_x,loc_y,made,kind='hexbin',stat='fg_pct',bin_size=15.0,min_attempts=1,title=None):
+    fig, ax = plt.subplots(figsize=(6,5.64))
+    image = drawShots(ax,loc_x,loc_y,made,kind,stat,bin_size,min_attempts)
+    fig.colorbar(image,ax=ax,label='FG%' if stat == 'fg_pct' else 'Attempts')
+    drawCourtOverlay(ax)
+    ax.set_title(title if title is not None else getTitle(loc_x,made))
+    return fig
+
+if __name__ == '__main__':
+    args = parseArguments()
+
+    if args.csv is not None:
+        loc_x, loc_y, made = getCSVShots(args.csv)
+    else:
+        with closing(Queries(args.db)) as queries:
+            league_id = queries.getLeagueID(args.league) if args.league is not None else None
+            shots = queries.getShots(args.player,args.team,league_id,args.season,args.start,args.end)
+        loc_x, loc_y, made = shots['loc_x'], shots['loc_y'], shots['shot_made_flag']
+
+    fig = plotShotChart(loc_x,loc_y,made,args.kind,args.stat,args.bin_size,args.min_attempts)
+    fig.savefig(args.output)
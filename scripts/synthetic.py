@@ -0,0 +1,409 @@
+import argparse
+import json
+from datetime import date, timedelta
+from functools import lru_cache
+from math import atan2, cos, degrees, radians, sin
+from random import Random
+import requests
+
+# fake stats.nba.com payloads for whole seasons of every league, in the same shape as the real endpoints
+# everything is seeded from the league, season and game ids, so the same request always gets the same payload
+# SyntheticSession can stand in for the requests session in etl.py to run the ETL without network access
+
+leagues = {
+    '00':{'teams':30,'games_per_team':82,'first_team_id':1610612737,'first_player_id':1630000,'season_start':(10,19),'season_end':(4,10),'period_minutes':12},
+    '10':{'teams':12,'games_per_team':36,'first_team_id':1611661313,'first_player_id':1640000,'season_start':(5,6),'season_end':(9,19),'period_minutes':10},
+    '20':{'teams':28,'games_per_team':50,'first_team_id':1612709889,'first_player_id':1650000,'season_start':(11,4),'season_end':(3,30),'period_minutes':12},
+}
+roster_size = 15
+first_names = ['James','Kevin','Donovan','Rudy','Mike','Jordan','Bojan','Joe','Eric','Hassan','Luka','Nikola','Trae','Devin','Jayson','Breanna','Diana','Sue','Candace','Jonquel']
+last_names = ['Mitchell','Gobert','Conley','Clarkson','Bogdanovic','Ingles','Paschall','Whiteside','Doncic','Jokic','Young','Booker','Tatum','Stewart','Taurasi','Bird','Parker','Jones','Smith','Brown']
+cities = ['Utah','Indiana','Boston','Denver','Dallas','Atlanta','Phoenix','Seattle','Chicago','Portland','Houston','Memphis','Toronto','Miami','Orlando','Detroit']
+
+# (eventmsgactiontype, action_type, max shot distance in feet) of the 2 point shots
+two_point_actions = [(1,'Jump Shot',22),(5,'Layup Shot',3),(7,'Dunk Shot',2),(42,'Driving Layup Shot',4),(79,'Pullup Jump shot',20),(80,'Step Back Jump shot',22)]
+three_point_actions = [(1,'Jump Shot',27),(79,'Pullup Jump shot',28),(80,'Step Back Jump shot',29)]
+
+
+def parseArguments():
+    # argparse to get which payload to print
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-endpoint',help='endpoint to fake (commonteamyears,teaminfocommon,leaguegamelog,playbyplayv2,commonplayerinfo,shotchartdetail)',required=True)
+    parser.add_argument('-params',help='json of the request parameters',default='{}')
+    args = parser.parse_args()
+    return args
+
+def getFrame(name,headers,rows):
+    return {'name':name,'headers':[header.upper() for header in headers],'rowSet':rows}
+
+def getSeasonYear(season):
+    # '2021-22' for the NBA and G League, '2021' for the WNBA
+    return int(str(season)[0:4])
+
+def getTeamID(league_id,team_index):
+    return leagues[league_id]['first_team_id'] + team_index
+
+def getTeamIndex(league_id,team_id):
+    return int(team_id) - leagues[league_id]['first_team_id']
+
+def getTeamAbbreviation(league_id,team_index):
+    return chr(65 + team_index % 26) + chr(65 + (team_index // 26 + int(league_id) // 10) % 26) + chr(65 + (team_index * 7) % 26)
+
+def getPlayerID(league_id,team_index,player_index):
+    return leagues[league_id]['first_player_id'] + team_index * 20 + player_index
+
+def getPlayerName(player_id):
+    return first_names[player_id % len(first_names)], last_names[(player_id // len(first_names)) % len(last_names)]
+
+def getSeasonDates(league_id,season_year):
+    league = leagues[league_id]
+    first_date = date(season_year,*league['season_start'])
+    last_date = date(season_year + (1 if league['season_end'] < league['season_start'] else 0),*league['season_end'])
+    return first_date, last_date
+
+@lru_cache(maxsize=None)
+def getSchedule(league_id,season_year):
+    # {game_id: (game_date, home team_index, away team_index)} of the regular season
+    # every team plays about games_per_team games, spread over the season's dates without a team playing twice on a date
+    league = leagues[league_id]
+    rng = Random(f'schedule {league_id} {season_year}')
+    first_date, last_date = getSeasonDates(league_id,season_year)
+    dates = [first_date + timedelta(day) for day in range((last_date - first_date).days + 1)]
+    game_count = league['teams'] * league['games_per_team'] // 2
+    date_game_counts = [0] * len(dates)
+    for game_index in range(game_count):
+        date_game_counts[game_index * len(dates) // game_count] += 1
+
+    schedule = {}
+    for game_date, date_game_count in zip(dates,date_game_counts):
+        team_indexes = rng.sample(range(league['teams']),min(league['teams'] // 2,date_game_count) * 2)
+        for home_index, away_index in zip(team_indexes[0::2],team_indexes[1::2]):
+            game_id = f'{league_id}2{season_year % 100:02d}{len(schedule) + 1:05d}'
+            schedule[game_id] = (game_date,home_index,away_index)
+    return schedule
+
+def getGame(game_id):
+    # game ids are <league_id>2<yy><number>, so the schedule can be found from the id alone
+    league_id = game_id[0:2]
+    season_year = 2000 + int(game_id[3:5])
+    return league_id, season_year, getSchedule(league_id,season_year)[game_id]
+
+def getClock(seconds):
+    return f'{seconds // 60}:{seconds % 60:02d}'
+
+def getShotLocation(rng,three,max_distance):
+    # loc_x and loc_y in tenths of a foot with the hoop at (0,0), a quarter of the threes are corner threes
+    if three and rng.random() < 0.25:
+        loc_x = rng.choice([-1,1]) * rng.randint(221,235)
+        loc_y = rng.randint(-40,90)
+    elif three:
+        distance = rng.uniform(237.5,max_distance * 10)
+        angle = radians(rng.uniform(-68,68))
+        loc_x, loc_y = round(distance * sin(angle)), round(distance * cos(angle))
+    else:
+        distance = rng.uniform(0,max_distance * 10)
+        angle = radians(rng.uniform(-90,90))
+        loc_x, loc_y = round(distance * sin(angle)), max(-40,round(distance * cos(angle)))
+    return loc_x, loc_y
+
+def getShotZones(loc_x,loc_y,three):
+    # shot_zone_basic, shot_zone_area, shot_zone_range and shot_distance like the api, negative loc_x is the right side
+    distance = (loc_x ** 2 + loc_y ** 2) ** 0.5 / 10
+    if three and loc_y <= 92.5:
+        zone_basic = 'Right Corner 3' if loc_x < 0 else 'Left Corner 3'
+    elif three:
+        zone_basic = 'Above the Break 3'
+    elif distance < 4:
+        zone_basic = 'Restricted Area'
+    elif abs(loc_x) < 80 and loc_y < 142.5:
+        zone_basic = 'In The Paint (Non-RA)'
+    else:
+        zone_basic = 'Mid-Range'
+
+    angle = degrees(atan2(loc_x,loc_y))
+    if distance < 8:
+        zone_area = 'Center(C)'
+    elif angle < -55:
+        zone_area = 'Right Side(R)'
+    elif angle < -20:
+        zone_area = 'Right Side Center(RC)'
+    elif angle <= 20:
+        zone_area = 'Center(C)'
+    elif angle <= 55:
+        zone_area = 'Left Side Center(LC)'
+    else:
+        zone_area = 'Left Side(L)'
+
+    if distance < 8:
+        zone_range = 'Less Than 8 ft.'
+    elif distance < 16:
+        zone_range = '8-16 ft.'
+    elif distance < 24:
+        zone_range = '16-24 ft.'
+    else:
+        zone_range = '24+ ft.'
+    return zone_basic, zone_area, zone_range, int(distance)
+
+pbp_headers = ['game_id','eventnum','eventmsgtype','eventmsgactiontype','period','wctimestring','pctimestring','homedescription','neutraldescription','visitordescription','score','scoremargin','person1type','player1_id','player1_name','player1_team_id','person2type','player2_id','player2_name','player2_team_id','person3type','player3_id','player3_name','player3_team_id','video_available_flag']
+shot_headers = ['grid_type','game_id','game_event_id','player_id','player_name','team_id','team_name','period','minutes_remaining','seconds_remaining','event_type','action_type','shot_type','shot_zone_basic','shot_zone_area','shot_zone_range','shot_distance','loc_x','loc_y','shot_attempted_flag','shot_made_flag','game_date','htm','vtm']
+box_headers = ['fgm','fga','fg3m','fg3a','ftm','fta','oreb','dreb','ast','stl','blk','tov','pf','pts']
+
+@lru_cache(maxsize=32)
+def simulateGame(game_id):
+    # plays a game possession by possession and returns its playbyplayv2 rows, shotchartdetail rows and team box scores
+    # the rows add up the way the real ones do: made shots and free throws in the descriptions match the points in the box scores
+    league_id, season_year, (game_date, home_index, away_index) = getGame(game_id)
+    league = leagues[league_id]
+    rng = Random(f'game {game_id}')
+    team_indexes = {'home':home_index,'away':away_index}
+    team_ids = {side:getTeamID(league_id,team_index) for side, team_index in team_indexes.items()}
+    rosters = {side:[getPlayerID(league_id,team_index,player_index) for player_index in range(roster_size)] for side, team_index in team_indexes.items()}
+    on_court = {side:rosters[side][0:5] for side in rosters}
+    box = {side:dict.fromkeys(box_headers,0) for side in rosters}
+    other_side = {'home':'away','away':'home'}
+    abbreviations = {side:getTeamAbbreviation(league_id,team_index) for side, team_index in team_indexes.items()}
+    events = []
+    shots = []
+
+    def addEvent(side,event_type,action_type,period,clock,description=None,person_1=None,person_2=None,scored=False):
+        # side None is a neutral event like the start of a period
+        score = None
+        score_margin = None
+        if scored:
+            score = f"{box['away']['pts']} - {box['home']['pts']}"
+            margin = box['home']['pts'] - box['away']['pts']
+            score_margin = 'TIE' if margin == 0 else str(margin)
+        persons = []
+        for person_side, player_id in [(side,person_1),(other_side.get(side),person_2)]:
+            if player_id is None:
+                persons += [0,0,None,None]
+            else:
+                # person 2 of a substitution is on the same team as person 1
+                person_side = side if event_type == 8 else person_side
+                persons += [4 if person_side == 'home' else 5,player_id,' '.join(getPlayerName(player_id)),team_ids[person_side]]
+        events.append([
+            game_id,len(events) + 1,event_type,action_type,period,'7:10 PM',getClock(clock),
+            description if side == 'home' else None,
+            description if side is None else None,
+            description if side == 'away' else None,
+            score,score_margin,*persons,0,0,None,None,1,
+        ])
+        return len(events)
+
+    period = 0
+    offense = rng.choice(['home','away'])
+    while period < 4 or box['home']['pts'] == box['away']['pts']:
+        period += 1
+        # overtime periods are 5 minutes
+        clock = league['period_minutes'] * 60 if period <= 4 else 300
+        addEvent(None,12,0,period,clock,f'Start of {period} Period')
+        while True:
+            clock -= rng.randint(4,24)
+            if clock <= 0:
+                break
+            roll = rng.random()
+            if roll < 0.05:
+                # substitution, person 1 goes out and person 2 comes in
+                side = rng.choice(['home','away'])
+                player_out = rng.choice(on_court[side])
+                player_in = rng.choice([player_id for player_id in rosters[side][0:10] if player_id not in on_court[side]])
+                on_court[side][on_court[side].index(player_out)] = player_in
+                addEvent(side,8,0,period,clock,f'SUB: {getPlayerName(player_in)[1]} FOR {getPlayerName(player_out)[1]}',player_out,player_in)
+                continue
+            if roll < 0.07:
+                addEvent(offense,9,1,period,clock,f'{abbreviations[offense]} Timeout: Regular')
+                continue
+            if roll < 0.19:
+                player_id = rng.choice(on_court[offense])
+                stealer_id = rng.choice(on_court[other_side[offense]])
+                box[offense]['tov'] += 1
+                box[other_side[offense]]['stl'] += 1
+                addEvent(offense,5,1,period,clock,f'{getPlayerName(player_id)[1]} Bad Pass Turnover',player_id,stealer_id)
+                offense = other_side[offense]
+                continue
+
+            # a shot
+            shooter_id = rng.choice(on_court[offense])
+            three = rng.random() < 0.38
+            action_type, action_name, max_distance = rng.choice(three_point_actions if three else two_point_actions)
+            made = rng.random() < (0.36 if three else 0.52)
+            loc_x, loc_y = getShotLocation(rng,three,max_distance)
+            zone_basic, zone_area, zone_range, distance = getShotZones(loc_x,loc_y,three)
+            shot_value = 3 if three else 2
+            team_box = box[offense]
+            team_box['fga'] += 1
+            team_box['fg3a'] += int(three)
+            last_name = getPlayerName(shooter_id)[1]
+            if made:
+                team_box['fgm'] += 1
+                team_box['fg3m'] += int(three)
+                team_box['pts'] += shot_value
+                team_box['ast'] += int(rng.random() < 0.6)
+                description = f"{last_name} {distance}' {'3PT ' if three else ''}{action_name} ({team_box['pts']} PTS)"
+            else:
+                description = f"MISS {last_name} {distance}' {'3PT ' if three else ''}{action_name}"
+            event_number = addEvent(offense,1 if made else 2,action_type,period,clock,description,shooter_id,scored=made)
+            shots.append([
+                'Shot Chart Detail',game_id,event_number,shooter_id,' '.join(getPlayerName(shooter_id)),team_ids[offense],abbreviations[offense],
+                period,clock // 60,clock % 60,'Made Shot' if made else 'Missed Shot',action_name,f'{shot_value}PT Field Goal',
+                zone_basic,zone_area,zone_range,distance,loc_x,loc_y,1,int(made),game_date.strftime('%Y%m%d'),abbreviations['home'],abbreviations['away'],
+            ])
+
+            if not made and rng.random() < 0.12:
+                # shooting foul and free throws, in the G League one free throw is worth what the shot was
+                # except in the last 2 minutes of the 4th period and overtime
+                fouler_id = rng.choice(on_court[other_side[offense]])
+                box[other_side[offense]]['pf'] += 1
+                addEvent(other_side[offense],6,2,period,clock,f'{getPlayerName(fouler_id)[1]} S.FOUL',fouler_id,shooter_id)
+                if league_id == '20' and not (period >= 4 and clock <= 120):
+                    free_throws = [(10,'1 of 1',shot_value)]
+                else:
+                    free_throws = [(10 + shot_value - 1 + number,f'{number} of {shot_value}',1) for number in range(1,shot_value + 1)]
+                for free_throw_action, free_throw_name, free_throw_value in free_throws:
+                    value_name = f' ({free_throw_value}PT)' if league_id == '20' and len(free_throws) == 1 else ''
+                    team_box['fta'] += 1
+                    if rng.random() < 0.77:
+                        team_box['ftm'] += 1
+                        team_box['pts'] += free_throw_value
+                        addEvent(offense,3,free_throw_action,period,clock,f"{last_name} Free Throw {free_throw_name}{value_name} ({team_box['pts']} PTS)",shooter_id,scored=True)
+                    else:
+                        addEvent(offense,3,free_throw_action,period,clock,f'MISS {last_name} Free Throw {free_throw_name}{value_name}',shooter_id)
+                offense = other_side[offense]
+            elif made:
+                offense = other_side[offense]
+            else:
+                # a quarter of the misses are offensive rebounds
+                rebound_side = offense if rng.random() < 0.25 else other_side[offense]
+                rebounder_id = rng.choice(on_court[rebound_side])
+                box[rebound_side]['oreb' if rebound_side == offense else 'dreb'] += 1
+                box[other_side[rebound_side]]['blk'] += int(rng.random() < 0.08)
+                addEvent(rebound_side,4,0,period,clock,f'{getPlayerName(rebounder_id)[1]} REBOUND',rebounder_id)
+                offense = rebound_side
+        addEvent(None,13,0,period,0,f'End of {period} Period')
+    return events, shots, box, period
+
+@lru_cache(maxsize=None)
+def getBoxScores(game_id):
+    # only the box scores are kept for every game, the game log of a whole season needs all of them
+    _, _, box, periods = simulateGame(game_id)
+    return box, periods
+
+def getPct(makes,attempts):
+    return round(makes / attempts,3) if attempts else None
+
+def getCommonTeamYears(params):
+    league_id = params['LeagueID']
+    headers = ['league_id','team_id','min_year','max_year','abbreviation']
+    rows = [[league_id,getTeamID(league_id,team_index),'2000',str(date.today().year),getTeamAbbreviation(league_id,team_index)] for team_index in range(leagues[league_id]['teams'])]
+    return [getFrame('TeamYears',headers,rows)]
+
+def getTeamInfoCommon(params):
+    league_id = params['LeagueID']
+    team_index = getTeamIndex(league_id,params['TeamID'])
+    headers = ['team_id','season_year','team_city','team_name','team_abbreviation','team_conference','team_division','team_code','team_slug','w','l','pct','conf_rank','div_rank','min_year','max_year']
+    city = cities[team_index % len(cities)]
+    name = f'{last_names[team_index % len(last_names)]}s'
+    row = [getTeamID(league_id,team_index),params['Season'],city,name,getTeamAbbreviation(league_id,team_index),'West' if team_index % 2 else 'East',f'Division {team_index % 3 + 1}',name.lower(),name.lower(),0,0,0.0,0,0,'2000',str(date.today().year)]
+    return [getFrame('TeamInfoCommon',headers,[row])]
+
+def getLeagueGameLog(params):
+    league_id = params['LeagueID']
+    season_year = getSeasonYear(params['Season'])
+    headers = ['season_id','team_id','team_abbreviation','team_name','game_id','game_date','matchup','wl','min','fgm','fga','fg_pct','fg3m','fg3a','fg3_pct','ftm','fta','ft_pct','oreb','dreb','reb','ast','stl','blk','tov','pf','pts','plus_minus','video_available']
+    rows = []
+    if params['SeasonType'] != 'Regular Season':
+        return [getFrame('LeagueGameLog',headers,rows)]
+    date_from = str(params.get('DateFrom') or '0000-00-00')
+    date_to = str(params.get('DateTo') or '9999-99-99')
+    for game_id, (game_date, home_index, away_index) in getSchedule(league_id,season_year).items():
+        if not date_from <= game_date.isoformat() <= date_to:
+            continue
+        box, periods = getBoxScores(game_id)
+        abbreviations = {'home':getTeamAbbreviation(league_id,home_index),'away':getTeamAbbreviation(league_id,away_index)}
+        for side, other_side, team_index in [('home','away',home_index),('away','home',away_index)]:
+            team_box = box[side]
+            matchup = f"{abbreviations['home']} vs. {abbreviations['away']}" if side == 'home' else f"{abbreviations['away']} @ {abbreviations['home']}"
+            plus_minus = team_box['pts'] - box[other_side]['pts']
+            rows.append([
+                f'2{season_year}',getTeamID(league_id,team_index),abbreviations[side],f'{last_names[team_index % len(last_names)]}s',game_id,game_date.isoformat(),matchup,
+                'W' if plus_minus > 0 else 'L',240 + (periods - 4) * 25,
+                team_box['fgm'],team_box['fga'],getPct(team_box['fgm'],team_box['fga']),
+                team_box['fg3m'],team_box['fg3a'],getPct(team_box['fg3m'],team_box['fg3a']),
+                team_box['ftm'],team_box['fta'],getPct(team_box['ftm'],team_box['fta']),
+                team_box['oreb'],team_box['dreb'],team_box['oreb'] + team_box['dreb'],
+                team_box['ast'],team_box['stl'],team_box['blk'],team_box['tov'],team_box['pf'],team_box['pts'],plus_minus,1,
+            ])
+    return [getFrame('LeagueGameLog',headers,rows)]
+
+def getPlayByPlay(params):
+    events, _, _, _ = simulateGame(params['GameID'])
+    return [getFrame('PlayByPlay',pbp_headers,events)]
+
+def getCommonPlayerInfo(params):
+    player_id = int(params['PlayerID'])
+    rng = Random(f'player {player_id}')
+    first_name, last_name = getPlayerName(player_id)
+    headers = ['person_id','first_name','last_name','display_first_last','birthdate','school','country','height','weight','season_exp','jersey','position','team_id','draft_year','draft_round','draft_number']
+    drafted = rng.random() < 0.8
+    row = [
+        player_id,first_name,last_name,f'{first_name} {last_name}',f'{rng.randint(1985,2002)}-{rng.randint(1,12):02d}-{rng.randint(1,28):02d}T00:00:00',
+        rng.choice(['Utah','Gonzaga','Kentucky','Duke','UConn',None]),rng.choice(['USA','USA','USA','France','Slovenia','Australia']),
+        f'{rng.randint(5,7)}-{rng.randint(0,11)}',str(rng.randint(160,260)),rng.randint(0,15),str(rng.randint(0,99)),rng.choice(['Guard','Forward','Center']),0,
+        str(rng.randint(2005,2021)) if drafted else 'Undrafted',str(rng.randint(1,2)) if drafted else 'Undrafted',str(rng.randint(1,30)) if drafted else 'Undrafted',
+    ]
+    return [getFrame('CommonPlayerInfo',headers,[row])]
+
+def getShotChartDetail(params):
+    league_id = params['LeagueID']
+    rows = []
+    if params['SeasonType'] != 'Regular Season':
+        return [getFrame('Shot_Chart_Detail',shot_headers,rows)]
+    date_from = str(params.get('DateFrom') or '0000-00-00')
+    date_to = str(params.get('DateTo') or '9999-99-99')
+    # a date range can cross into the next calendar year, so both seasons it may touch are checked
+    for season_year in sorted({int(date_from[0:4]) - 1,int(date_from[0:4])}):
+        if season_year < 2000:
+            continue
+        for game_id, (game_date, _, _) in getSchedule(league_id,season_year).items():
+            if date_from <= game_date.isoformat() <= date_to:
+                _, shots, _, _ = simulateGame(game_id)
+                rows += shots
+    return [getFrame('Shot_Chart_Detail',shot_headers,rows)]
+
+endpoints = {
+    'commonteamyears':getCommonTeamYears,
+    'teaminfocommon':getTeamInfoCommon,
+    'leaguegamelog':getLeagueGameLog,
+    'playbyplayv2':getPlayByPlay,
+    'commonplayerinfo':getCommonPlayerInfo,
+    'shotchartdetail':getShotChartDetail,
+}
+
+def getPayload(endpoint,params):
+    # the decoded json the api would return for the endpoint and params
+    return {'resource':endpoint,'parameters':params,'resultSets':endpoints[endpoint](params)}
+
+class SyntheticResponse:
+    # the parts of a requests.Response that etl.getResponse uses
+    def __init__(self,content,status_code=200,headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.ok = status_code < 400
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f'{self.status_code} error',response=self)
+
+class SyntheticSession:
+    # stands in for the requests session in etl.py, answers every call with a synthetic payload
+    def get(self,url,params=None,headers=None,timeout=None):
+        endpoint = url.rsplit('/',1)[-1]
+        if endpoint not in endpoints:
+            return SyntheticResponse(b'',404)
+        return SyntheticResponse(json.dumps(getPayload(endpoint,{key:str(value) for key,value in (params or {}).items()})).encode())
+
+
+if __name__ == '__main__':
+    args = parseArguments()
+    print(json.dumps(getPayload(args.endpoint,json.loads(args.params))))